@@ -13,11 +13,27 @@ backup_dir="."
 : > "$ok_report"
 : > "$out_bad"
 
-filter_bad_log() {
-  sed -E \
-    -e '/edit list/d' \
-    -e '/Cannot find an index entry/d' \
-    -e '/Missing key frame while searching for timestamp/d'
+# Log lines kept from the start and from the end of each message class
+log_examples="${LOG_EXAMPLES:-5}"
+
+# The log classifier is shared with the other script; keep it next to them.
+summarize_awk="$(dirname "${BASH_SOURCE[0]}")/summarize_log.awk"
+if [[ ! -f "$summarize_awk" ]]; then
+  echo "Missing $summarize_awk: copy summarize_log.awk next to this script." >&2
+  exit 1
+fi
+
+log_dir="$(mktemp -d)"
+trap 'rm -rf "$log_dir"' EXIT
+
+summarize_log() {
+  # Prints CORRUPT or OK; the summaries go to $1 (filtered for bad) and $2 (raw).
+  # Lines are stamped on arrival: to the microsecond with bash 5
+  # (EPOCHREALTIME), in whole seconds with older bash (SECONDS).
+  local start="${EPOCHREALTIME:-$SECONDS}" line
+  while IFS= read -r line || [[ -n "$line" ]]; do
+    printf '%s\t%s\n' "${EPOCHREALTIME:-$SECONDS}" "$line"
+  done | awk -v n="$log_examples" -v start="$start" -v filtered="$1" -v raw="$2" -f "$summarize_awk"
 }
 
 fix_file() {
@@ -59,20 +75,17 @@ fix_file() {
 for f in MVI_*.MP4; do
   echo "Checking: $f"
 
-  raw_log="$(ffmpeg -hide_banner -v warning -i "$f" -f null - 2>&1 || true)"
-  bad_log="$(printf '%s\n' "$raw_log" | filter_bad_log)"
+  # stderr is summarized while ffmpeg runs instead of being held in memory
+  status="$(ffmpeg -hide_banner -v warning -i "$f" -f null - 2>&1 >/dev/null \
+    | summarize_log "$log_dir/bad" "$log_dir/raw" || true)"
 
-  if printf '%s\n' "$bad_log" | grep -qi "corrupt"; then
+  if [[ "$status" == *CORRUPT* ]]; then
     echo "$f" >> "$out_bad"
     {
       echo "FILE: $f"
       echo "STATUS: CORRUPT (matched 'corrupt' after filtering)"
-      echo "LOG (filtered for bad):"
-      if [[ -n "${bad_log//[[:space:]]/}" ]]; then
-        printf '%s\n' "$bad_log" | sed 's/^/  /'
-      else
-        echo "  <empty after filtering>"
-      fi
+      echo "LOG SUMMARY (filtered for bad):"
+      cat "$log_dir/bad"
       echo "ACTION: fixing -> backup as CORRUPT_*, fixed back to original name"
       echo
     } >> "$bad_report"
@@ -83,12 +96,8 @@ for f in MVI_*.MP4; do
     {
       echo "FILE: $f"
       echo "STATUS: OK (no 'corrupt' after filtering)"
-      echo "LOG (raw):"
-      if [[ -n "${raw_log//[[:space:]]/}" ]]; then
-        printf '%s\n' "$raw_log" | sed 's/^/  /'
-      else
-        echo "  <empty>"
-      fi
+      echo "LOG SUMMARY (raw):"
+      cat "$log_dir/raw"
       echo
     } >> "$ok_report"
   fi
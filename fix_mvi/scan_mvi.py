@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import glob
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+
+# Same rules as summarize_log.awk of the shell scripts: these index/edit-list/
+# timestamp-index warnings are ignored when classifying a file.
+BAD_LOG_FILTERS = (
+    "edit list",
+    "Cannot find an index entry",
+    "Missing key frame while searching for timestamp",
+)
+
+# Decoder message classes of the log summaries, in match order. A file is
+# corrupt when the first one shows up; all of them mark the frame being
+# decoded as damaged, used to find the GOPs to repair. summarize_log.awk, shared
+# by the shell scripts, mirrors this list.
+LOG_CLASSES = ("corrupt", "error while decoding", "concealing")
+CORRUPT_CLASS = LOG_CLASSES[0]
+
+# Encoders able to produce pieces that splice into a stream of this codec.
+GOP_ENCODERS = {
+    "h264": ["-c:v", "libx264", "-crf", "18", "-preset", "slow"],
+    "hevc": ["-c:v", "libx265", "-crf", "18", "-preset", "slow"],
+}
+
+# Examples kept from the start and from the end of each log class.
+LOG_EXAMPLES = 5
+
+CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS scan_result (
+  name TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  raw_log TEXT NOT NULL,
+  scanned_at TEXT NOT NULL,
+  tier TEXT NOT NULL DEFAULT 'full',
+  summary TEXT
+)
+"""
+
+# -loglevel level+info tags every line; warning and above is what a
+# "-v warning" run would print.
+LEVEL_RE = re.compile(r"\[(panic|fatal|error|warning|info|verbose|debug|trace)\] ")
+LOG_LEVELS = ("panic", "fatal", "error", "warning")
+SHOWINFO_RE = re.compile(r"\bn:\s*(\d+).*?\bpts_time:\s*(-?[\d.]+)")
+
+TIER_LABELS = {
+    "quick": "quick (packet read + keyframe decode)",
+    "full": "full (decode)",
+}
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def classify_line(line):
+    for pattern in BAD_LOG_FILTERS:
+        if pattern in line:
+            return f"ignored: {pattern}"
+    lower = line.lower()
+    for name in LOG_CLASSES:
+        if name in lower:
+            return name
+    return "other"
+
+
+class LogSummary:
+    # Streaming summary of an ffmpeg log: a line count per class plus the
+    # first and last `examples` lines of each class, with the time since the
+    # decode started and, when known, the media time of the last decoded
+    # frame. Memory stays the same however noisy the file is.
+    def __init__(self, examples=LOG_EXAMPLES):
+        self.examples = examples
+        self.classes = {}
+        self.started = time.monotonic()
+        self.media_t = None
+
+    def add(self, line):
+        line = line.rstrip()
+        if not line.strip():
+            return
+        name = classify_line(line)
+        entry = self.classes.get(name)
+        if entry is None:
+            entry = self.classes[name] = {"count": 0, "first": [], "last": deque(maxlen=self.examples)}
+        entry["count"] += 1
+        example = {"wall_s": round(time.monotonic() - self.started, 3), "t": self.media_t, "line": line}
+        if len(entry["first"]) < self.examples:
+            entry["first"].append(example)
+        else:
+            entry["last"].append(example)
+
+    def corrupt(self):
+        return CORRUPT_CLASS in self.classes
+
+    def suspect(self):
+        return any(not name.startswith("ignored") for name in self.classes)
+
+    def to_json(self):
+        return json.dumps(
+            {
+                name: {"count": entry["count"], "first": entry["first"], "last": list(entry["last"])}
+                for name, entry in self.classes.items()
+            }
+        )
+
+    @classmethod
+    def from_json(cls, text, examples=LOG_EXAMPLES):
+        summary = cls(examples)
+        for name, entry in json.loads(text).items():
+            summary.classes[name] = {
+                "count": entry["count"],
+                "first": entry["first"],
+                "last": deque(entry["last"], maxlen=max(examples, len(entry["last"]))),
+            }
+        return summary
+
+    @classmethod
+    def from_text(cls, raw_log, examples=LOG_EXAMPLES):
+        # Raw logs cached by older versions; no timing is known for them.
+        summary = cls(examples)
+        for line in raw_log.split("\n"):
+            summary.add(line)
+        for entry in summary.classes.values():
+            for example in entry["first"] + list(entry["last"]):
+                example["wall_s"] = None
+        return summary
+
+    def report(self, filtered):
+        lines = []
+        for name, entry in self.classes.items():
+            if filtered and name.startswith("ignored"):
+                continue
+            lines.append(f"  {name}: {entry['count']} line{'s' if entry['count'] != 1 else ''}")
+            lines += [f"    {format_example(example)}" for example in entry["first"]]
+            skipped = entry["count"] - len(entry["first"]) - len(entry["last"])
+            if skipped > 0:
+                lines.append(f"    ... {skipped} more ...")
+            lines += [f"    {format_example(example)}" for example in entry["last"]]
+        return lines
+
+
+def format_example(example):
+    when = []
+    if example.get("wall_s") is not None:
+        when.append(f"+{example['wall_s']:.1f}s")
+    if example.get("t") is not None:
+        when.append(f"t={example['t']:.3f}")
+    return f"[{' '.join(when)}] {example['line']}" if when else example["line"]
+
+
+def run_streamed(cmd, on_line):
+    # ffmpeg's stderr is handled line by line while it runs, never held whole.
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    for raw in proc.stderr:
+        on_line(raw.decode("utf-8", "replace").rstrip("\r\n"))
+    return proc.wait()
+
+
+def file_identity(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def open_cache(path):
+    conn = sqlite3.connect(path)
+    conn.execute(CACHE_SQL)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(scan_result)")}
+    if "tier" not in columns:
+        conn.execute("ALTER TABLE scan_result ADD COLUMN tier TEXT NOT NULL DEFAULT 'full'")
+    if "summary" not in columns:
+        conn.execute("ALTER TABLE scan_result ADD COLUMN summary TEXT")
+    conn.commit()
+    return conn
+
+
+def cached_log(conn, name, identity, examples=LOG_EXAMPLES):
+    row = conn.execute(
+        "SELECT size, mtime_ns, raw_log, tier, summary FROM scan_result WHERE name = ?", (name,)
+    ).fetchone()
+    if row is None or (row[0], row[1]) != identity:
+        return None
+    if row[4] is None:
+        return LogSummary.from_text(row[2], examples), row[3]
+    return LogSummary.from_json(row[4], examples), row[3]
+
+
+def store_log(conn, name, identity, summary, tier="full"):
+    # Only the summary is kept; raw_log stays empty for new rows.
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO scan_result (name, size, mtime_ns, raw_log, scanned_at, tier, summary)
+        VALUES (?, ?, ?, '', ?, ?, ?)
+        """,
+        (name, identity[0], identity[1], iso_now(), tier, summary.to_json()),
+    )
+    conn.commit()
+
+
+class FrameLog:
+    # Reads a level-tagged showinfo decode line by line: warnings go to the
+    # summary, showinfo lines give the media time, and each decoder error
+    # becomes a (t, frame, message) entry for the next frame showinfo reports
+    # (the last one for errors at the end).
+    def __init__(self, summary):
+        self.summary = summary
+        self.entries = []
+        self.pending = []
+        self.keep = False
+        self.last = None
+
+    def add(self, line):
+        match = LEVEL_RE.search(line)
+        if match:
+            self.keep = match.group(1) in LOG_LEVELS
+            line = line[: match.start()] + line[match.end() :]
+            frame = SHOWINFO_RE.search(line) if "showinfo" in line else None
+            if frame:
+                self.last = (float(frame.group(2)), int(frame.group(1)))
+                self.summary.media_t = self.last[0]
+                self.entries += [self.last + (message,) for message in self.pending]
+                self.pending = []
+                return
+        if not self.keep or not line.strip():
+            return
+        self.summary.add(line)
+        if any(pattern in line for pattern in BAD_LOG_FILTERS):
+            return
+        if any(marker in line.lower() for marker in LOG_CLASSES):
+            self.pending.append(line.strip())
+
+    def finish(self):
+        if self.last is not None:
+            self.entries += [self.last + (message,) for message in self.pending]
+        self.pending = []
+        return self.entries
+
+
+def scan_file(path, threads, frames=False, examples=LOG_EXAMPLES):
+    # Returns (summary, entries); entries are only collected with frames=True.
+    cmd = ["ffmpeg", "-hide_banner"]
+    cmd += ["-nostats", "-loglevel", "level+info"] if frames else ["-v", "warning"]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd += ["-i", path]
+    if frames:
+        cmd += ["-vf", "showinfo"]
+    cmd += ["-f", "null", "-"]
+    summary = LogSummary(examples)
+    if not frames:
+        run_streamed(cmd, summary.add)
+        return summary, []
+    frame_log = FrameLog(summary)
+    run_streamed(cmd, frame_log.add)
+    return summary, frame_log.finish()
+
+
+def quick_scan_file(path, threads, examples=LOG_EXAMPLES):
+    # Tier 1: demux every packet but decode keyframes only. Container and
+    # packet errors still show up, at close to I/O speed.
+    cmd = ["ffmpeg", "-hide_banner", "-v", "warning", "-skip_frame", "nokey"]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd += ["-i", path, "-map", "0:v:0", "-f", "null", "-"]
+    summary = LogSummary(examples)
+    run_streamed(cmd, summary.add)
+    return summary
+
+
+def run_scans(pool, folder, items, scan):
+    futures = {pool.submit(scan, os.path.join(folder, name)): (name, identity) for name, identity in items}
+    for future in as_completed(futures):
+        name, identity = futures[future]
+        yield name, identity, future.result()
+
+
+def backup_original(path, backup_dir):
+    backup = os.path.join(backup_dir, f"CORRUPT_{os.path.basename(path)}")
+    if not os.path.isfile(backup):
+        os.replace(path, backup)
+    else:
+        os.remove(path)
+    return backup
+
+
+def reencode_full(backup, path):
+    # Same steps as fix_file() in fix_mvi.sh.
+    base = os.path.basename(path)
+    folder = os.path.dirname(path) or "."
+    tmp = os.path.join(folder, f".__FIXING__.{base}")
+    tmp2 = os.path.join(folder, f".__FIXING2__.{base}")
+    reencode = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-err_detect",
+        "ignore_err",
+        "-i",
+        backup,
+        "-c:v",
+        "libx264",
+        "-crf",
+        "18",
+        "-preset",
+        "slow",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "copy",
+        tmp,
+    ]
+    if subprocess.call(reencode, stdin=subprocess.DEVNULL) != 0:
+        return False
+    faststart = ["ffmpeg", "-hide_banner", "-y", "-i", tmp, "-c", "copy", "-movflags", "+faststart", tmp2]
+    rc = subprocess.call(faststart, stdin=subprocess.DEVNULL)
+    os.remove(tmp)
+    if rc != 0:
+        return False
+    os.replace(tmp2, path)
+    return True
+
+
+def probe_packets(path):
+    # Video packet times (sorted, relative to the file start) and keyframe times.
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=codec_name,avg_frame_rate,pix_fmt",
+        "-show_entries",
+        "format=start_time",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "json",
+        path,
+    ]
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    data = json.loads(result.stdout or b"{}")
+    stream = (data.get("streams") or [{}])[0]
+    rate = stream.get("avg_frame_rate") or "0/1"
+    num, _, den = rate.partition("/")
+    fps = float(num) / float(den) if float(den or 0) else 0.0
+    start = float((data.get("format") or {}).get("start_time") or 0.0)
+    times = []
+    keyframes = []
+    for packet in data.get("packets", []):
+        if packet.get("pts_time") in (None, "N/A"):
+            continue
+        t = float(packet["pts_time"]) - start
+        times.append(t)
+        if "K" in packet.get("flags", ""):
+            keyframes.append(t)
+    if not times or not keyframes or not fps:
+        return None
+    times.sort()
+    keyframes.sort()
+    return {
+        "codec": stream.get("codec_name"),
+        "pix_fmt": stream.get("pix_fmt") or "yuv420p",
+        "rate": rate,
+        "fps": fps,
+        "times": times,
+        "keyframes": keyframes,
+        "end": times[-1] + 1.0 / fps,
+    }
+
+
+def gop_spans(keyframes, end, times):
+    # Merged [start, end) ranges of the GOPs containing the given frame times.
+    eps = 1e-6
+    gops = sorted({max(bisect.bisect_right(keyframes, t + eps) - 1, 0) for t in times})
+    bounds = keyframes + [end]
+    spans = []
+    for idx in gops:
+        if spans and spans[-1][1] == bounds[idx]:
+            spans[-1][1] = bounds[idx + 1]
+        else:
+            spans.append([bounds[idx], bounds[idx + 1]])
+    return [tuple(span) for span in spans]
+
+
+def verify_spans(path, spans, frame_count):
+    for start, end in spans:
+        cmd = [
+            "ffmpeg", "-hide_banner", "-v", "warning", "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}",
+            "-i", path, "-map", "0:v:0", "-f", "null", "-",
+        ]
+        summary = LogSummary()
+        if run_streamed(cmd, summary.add) != 0 or summary.corrupt():
+            return False
+    info = probe_packets(path)
+    return info is not None and len(info["times"]) == frame_count
+
+
+def repair_gops(backup, path, info, spans):
+    # Stream-copy the file into pieces cut at the span boundaries, re-encode
+    # only the damaged pieces, then splice everything and the original audio
+    # in a single faststart write. Repaired ranges are decoded once more.
+    base = os.path.basename(path)
+    folder = os.path.dirname(path) or "."
+    work = tempfile.mkdtemp(prefix=f".__FIXING__.{base}.", dir=folder)
+    tmp = os.path.join(folder, f".__FIXING2__.{base}")
+    half = 0.5 / info["fps"]
+    try:
+        first = info["keyframes"][0]
+        cuts = sorted({t for span in spans for t in span if first + half < t < info["end"] - half})
+        bounds = [first] + cuts + [info["end"]]
+        split = ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-i", backup, "-map", "0:v:0", "-c", "copy"]
+        if cuts:
+            split += ["-f", "segment", "-segment_times", ",".join(f"{t - half:.6f}" for t in cuts)]
+        else:
+            split += ["-f", "segment", "-segment_time", f"{info['end'] * 2:.6f}"]
+        split += ["-reset_timestamps", "1", os.path.join(work, "seg_%05d.ts")]
+        if subprocess.call(split, stdin=subprocess.DEVNULL) != 0:
+            return False
+        segments = sorted(glob.glob(os.path.join(work, "seg_*.ts")))
+        if len(segments) != len(bounds) - 1:
+            return False
+
+        times = info["times"]
+        for start, end in spans:
+            idx = min(range(len(bounds)), key=lambda k: abs(bounds[k] - start))
+            frames = bisect.bisect_left(times, end - half) - bisect.bisect_left(times, start - half)
+            encode = [
+                "ffmpeg", "-hide_banner", "-v", "error", "-y", "-err_detect", "ignore_err",
+                "-ss", f"{start:.6f}", "-i", backup, "-map", "0:v:0", "-frames:v", str(frames),
+                "-vsync", "cfr", "-r", info["rate"],
+            ] + GOP_ENCODERS[info["codec"]] + ["-pix_fmt", info["pix_fmt"], "-f", "mpegts", segments[idx]]
+            if subprocess.call(encode, stdin=subprocess.DEVNULL) != 0:
+                return False
+
+        concat_list = os.path.join(work, "list.txt")
+        with open(concat_list, "w") as f:
+            f.write("".join(f"file '{os.path.basename(seg)}'\n" for seg in segments))
+        splice = [
+            "ffmpeg", "-hide_banner", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", concat_list,
+            "-i", backup, "-map", "0:v", "-map", "1:a?", "-c", "copy", "-movflags", "+faststart", tmp,
+        ]
+        if subprocess.call(splice, stdin=subprocess.DEVNULL) != 0:
+            return False
+        if not verify_spans(tmp, spans, len(times)):
+            return False
+        os.replace(tmp, path)
+        return True
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def fix_file(path, backup_dir, mode, times=None):
+    # Returns the repair that worked ("gop" or "full"), or None. GOP repair
+    # falls back to the full re-encode when it cannot be planned or verified.
+    # `times` are the damaged frame times if the scan already found them.
+    spans = None
+    info = None
+    if mode == "gop":
+        info = probe_packets(path)
+        if info is not None and info["codec"] in GOP_ENCODERS:
+            if not times:
+                times = [entry[0] for entry in scan_file(path, 1, frames=True)[1]]
+            if times:
+                # With reordered frames the damage can also sit on the frame
+                # shown just before the reported one.
+                frame = 1.0 / info["fps"]
+                spans = gop_spans(info["keyframes"], info["end"], times + [t - frame for t in times])
+    backup = backup_original(path, backup_dir)
+    if spans and repair_gops(backup, path, info, spans):
+        return "gop"
+    return "full" if reencode_full(backup, path) else None
+
+
+def open_media_db(path):
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("SELECT 1 FROM corrupt_frame LIMIT 1")
+    except sqlite3.OperationalError as exc:
+        conn.close()
+        raise RuntimeError("Database schema outdated. Run create_db.py first.") from exc
+    return conn
+
+
+def media_ids_by_path(conn, db_path):
+    # media_file.path is relative to the database folder.
+    base_dir = os.path.dirname(os.path.abspath(db_path))
+    return {
+        os.path.normpath(os.path.join(base_dir, path)): media_id
+        for media_id, path in conn.execute("SELECT id, path FROM media_file")
+    }
+
+
+def store_frames(conn, media_id, entries):
+    scanned_at = iso_now()
+    conn.execute("DELETE FROM corrupt_frame WHERE media_id = ?", (media_id,))
+    conn.executemany(
+        "INSERT INTO corrupt_frame (media_id, t, frame, message, scanned_at) VALUES (?, ?, ?, ?, ?)",
+        [(media_id, t, frame, message, scanned_at) for t, frame, message in entries],
+    )
+    conn.commit()
+
+
+def write_reports(folder, names, logs, fix, tiers=None):
+    # logs: LogSummary per file name. Reports list per-class counts and
+    # examples, not the whole log.
+    bad_lines = []
+    ok_lines = []
+    out_bad = []
+    for name in names:
+        summary = logs.get(name)
+        if summary is None:
+            continue
+        tier = [f"TIER: {TIER_LABELS[tiers[name]]}"] if tiers else []
+        if summary.corrupt():
+            out_bad.append(name)
+            bad_lines.append(f"FILE: {name}")
+            if fix:
+                bad_lines.append("STATUS: CORRUPT (matched 'corrupt' after filtering)")
+            else:
+                bad_lines.append("STATUS: CORRUPT (matched: 'corrupt' after filtering)")
+            bad_lines += tier
+            bad_lines.append("LOG SUMMARY (filtered for bad):")
+            bad_lines += summary.report(filtered=True) or ["  <empty after filtering>"]
+            if fix:
+                bad_lines.append("ACTION: fixing -> backup as CORRUPT_*, fixed back to original name")
+            bad_lines.append("")
+        else:
+            ok_lines.append(f"FILE: {name}")
+            ok_lines.append("STATUS: OK (no 'corrupt' after filtering)")
+            ok_lines += tier
+            ok_lines.append("LOG SUMMARY (raw):")
+            ok_lines += summary.report(filtered=False) or ["  <empty>"]
+            ok_lines.append("")
+
+    for fname, lines in (("out_bad.txt", out_bad), ("bad_report.txt", bad_lines), ("ok_report.txt", ok_lines)):
+        with open(os.path.join(folder, fname), "w") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+    return out_bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan MVI_*.MP4 files for corrupt frames (parallel, resumable).")
+    parser.add_argument("--dir", default=".", help="Folder with the video files; reports are written here")
+    parser.add_argument("--pattern", default="MVI_*.MP4")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Files decoded at the same time")
+    parser.add_argument("--threads", type=int, default=1, help="ffmpeg decoder threads per file (0 = ffmpeg default)")
+    parser.add_argument("--cache", default=None, help="Result cache (default: <dir>/scan_cache.db)")
+    parser.add_argument("--rescan", action="store_true", help="Ignore cached results")
+    parser.add_argument("--fix", action="store_true", help="Fix corrupt files like fix_mvi.sh")
+    parser.add_argument("--backup-dir", dest="backup_dir", default=None, help="Where CORRUPT_* originals go")
+    parser.add_argument(
+        "--repair",
+        choices=("gop", "full"),
+        default="gop",
+        help="gop: re-encode only the damaged GOPs; full: re-encode the whole file like fix_mvi.sh",
+    )
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        help="Quick packet/keyframe check first; full decode only for suspects and a random sample",
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        default=0.05,
+        help="Share of quick-clean files that still get a full decode (--triage)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --sample")
+    parser.add_argument(
+        "--log-examples",
+        dest="log_examples",
+        type=int,
+        default=LOG_EXAMPLES,
+        help="Log lines kept from the start and from the end of each message class",
+    )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Store the time and frame number of each damaged frame in this toweb.db",
+    )
+    args = parser.parse_args()
+    if args.log_examples < 1:
+        print("--log-examples must be at least 1")
+        return 1
+
+    folder = args.dir
+    names = sorted(os.path.basename(p) for p in glob.glob(os.path.join(folder, args.pattern)))
+    conn = open_cache(args.cache or os.path.join(folder, "scan_cache.db"))
+    media_conn = None
+    media_ids = {}
+    if args.db:
+        try:
+            media_conn = open_media_db(args.db)
+        except RuntimeError as exc:
+            print(str(exc))
+            return 1
+        media_ids = media_ids_by_path(media_conn, args.db)
+
+    logs = {}
+    tiers = {}
+    todo = []
+    known_bad = set()
+    for name in names:
+        identity = file_identity(os.path.join(folder, name))
+        cached = cached_log(conn, name, identity, args.log_examples)
+        if args.rescan and cached is not None:
+            # A rescan may not let a quick-clean result replace damage a full
+            # decode already found: those files skip the quick tier.
+            if cached[1] == "full" and cached[0].corrupt():
+                known_bad.add(name)
+            cached = None
+        # A quick-tier result only counts in --triage runs.
+        if cached is None or (cached[1] == "quick" and not args.triage):
+            todo.append((name, identity))
+        else:
+            logs[name], tiers[name] = cached
+    print(f"Files: {len(names)}, cached: {len(logs)}, to scan: {len(todo)}")
+
+    def quick_scan(path):
+        return quick_scan_file(path, args.threads, args.log_examples)
+
+    def full_scan(path):
+        return scan_file(path, args.threads, media_conn is not None, args.log_examples)
+
+    frame_times = {}
+    interrupted = False
+    pool = ThreadPoolExecutor(max_workers=max(1, args.jobs))
+    try:
+        full = todo
+        if args.triage:
+            suspects = [item for item in todo if item[0] in known_bad]
+            clean = []
+            if suspects:
+                print(f"Full tier: {len(suspects)} files corrupt in the last full decode")
+            quick_todo = [item for item in todo if item[0] not in known_bad]
+            for name, identity, quick_log in run_scans(pool, folder, quick_todo, quick_scan):
+                if quick_log.suspect():
+                    suspects.append((name, identity))
+                    print(f"Quick: {name} (suspect)")
+                    continue
+                clean.append((name, identity))
+                logs[name] = quick_log
+                tiers[name] = "quick"
+                store_log(conn, name, identity, quick_log, "quick")
+                print(f"Quick: {name}")
+            rng = random.Random(args.seed)
+            sampled = rng.sample(clean, min(len(clean), math.ceil(len(clean) * max(args.sample, 0.0))))
+            print(f"Quick tier: {len(clean)} clean, {len(suspects)} suspect, {len(sampled)} sampled for full decode")
+            full = sorted(suspects + sampled)
+        for name, identity, (summary, entries) in run_scans(pool, folder, full, full_scan):
+            logs[name] = summary
+            tiers[name] = "full"
+            # Stored as soon as it is known, so an interrupted run resumes here.
+            store_log(conn, name, identity, summary)
+            media_id = media_ids.get(os.path.abspath(os.path.join(folder, name)))
+            if media_id is not None:
+                store_frames(media_conn, media_id, entries)
+                frame_times[name] = [entry[0] for entry in entries]
+            elif media_conn is not None:
+                print(f"Not in media_file, frames not stored: {name}")
+            print(f"Checked: {name}{' (corrupt)' if summary.corrupt() else ''}")
+    except KeyboardInterrupt:
+        interrupted = True
+        pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        pool.shutdown()
+
+    bad = write_reports(folder, names, logs, args.fix and not interrupted, tiers if args.triage else None)
+    if interrupted:
+        print(f"Interrupted after {len(logs)}/{len(names)} files. Run again to resume.")
+        conn.close()
+        if media_conn is not None:
+            media_conn.close()
+        return 130
+
+    if args.fix and bad:
+        backup_dir = args.backup_dir or folder
+        os.makedirs(backup_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as fix_pool:
+            futures = {
+                fix_pool.submit(
+                    fix_file, os.path.join(folder, name), backup_dir, args.repair, frame_times.get(name)
+                ): name
+                for name in bad
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                repair = future.result()
+                if repair:
+                    # The repaired file is clean; cache it so it is not decoded again.
+                    store_log(conn, name, file_identity(os.path.join(folder, name)), LogSummary())
+                    media_id = media_ids.get(os.path.abspath(os.path.join(folder, name)))
+                    if media_id is not None:
+                        store_frames(media_conn, media_id, [])
+                    print(f"Fixed ({repair}): {name}")
+                else:
+                    print(f"Fix failed: {name}", file=sys.stderr)
+    conn.close()
+    if media_conn is not None:
+        media_conn.close()
+
+    print("Scan+fix finished." if args.fix else "Scan finished.")
+    print(f"Bad files list : {os.path.join(folder, 'out_bad.txt')}")
+    print(f"Bad report     : {os.path.join(folder, 'bad_report.txt')}")
+    print(f"OK report      : {os.path.join(folder, 'ok_report.txt')}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
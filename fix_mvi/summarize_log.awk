@@ -0,0 +1,60 @@
+# Summary of an ffmpeg log, shared by scan_mvi.sh and fix_mvi.sh.
+#
+# Reads the log on stdin as it is written and keeps, per message class, a
+# line count plus the first and last n lines, so memory does not grow with a
+# noisy file. Each input line is "<arrival time>\t<log line>"; the examples
+# are tagged with the time since start, like the [+1.2s] of scan_mvi.py. Index/edit-list/timestamp-index
+# warnings are ignored in BAD classification/log. Prints CORRUPT or OK; the
+# summaries go to the files named by filtered (filtered for bad) and raw.
+#
+# awk -v n=5 -v start=EPOCH -v filtered=FILE -v raw=FILE -f summarize_log.awk
+function add(cls) {
+  if (!(cls in count)) { order[++classes] = cls; count[cls] = 0 }
+  c = ++count[cls]
+  if (c <= n) first[cls, c] = when $0
+  else last[cls, c % n] = when $0
+}
+function report(out, skip_ignored,   i, cls, c, from, empty) {
+  empty = 1
+  for (i = 1; i <= classes; i++) {
+    cls = order[i]
+    if (skip_ignored && cls ~ /^ignored/) continue
+    empty = 0
+    print "  " cls ": " count[cls] " line" (count[cls] == 1 ? "" : "s") > out
+    for (c = 1; c <= n && c <= count[cls]; c++) print "    " first[cls, c] > out
+    from = count[cls] - n + 1
+    if (from <= n) from = n + 1
+    if (from > n + 1) print "    ... " (from - n - 1) " more ..." > out
+    for (c = from; c <= count[cls]; c++) print "    " last[cls, c % n] > out
+  }
+  if (empty) print (skip_ignored ? "  <empty after filtering>" : "  <empty>") > out
+  close(out)
+}
+BEGIN {
+  # BAD_LOG_FILTERS and LOG_CLASSES of scan_mvi.py, in the same order.
+  nf = split("edit list|Cannot find an index entry|Missing key frame while searching for timestamp", filters, "|")
+  nc = split("corrupt|error while decoding|concealing", classes_of, "|")
+  # bash prints EPOCHREALTIME with the decimal separator of the locale.
+  sub(/,/, ".", start)
+}
+{
+  tab = index($0, "\t")
+  ts = substr($0, 1, tab - 1)
+  sub(/,/, ".", ts)
+  when = sprintf("[+%.1fs] ", ts - start)
+  $0 = substr($0, tab + 1)
+  sub(/\r$/, "")
+}
+/^[[:space:]]*$/ { next }
+{
+  cls = "other"
+  for (i = 1; i <= nf; i++) if (index($0, filters[i])) { cls = "ignored: " filters[i]; break }
+  line = tolower($0)
+  for (i = 1; cls == "other" && i <= nc; i++) if (index(line, classes_of[i])) cls = classes_of[i]
+  add(cls)
+}
+END {
+  report(filtered, 1)
+  report(raw, 0)
+  print ((classes_of[1] in count) ? "CORRUPT" : "OK")
+}
@@ -1,8 +1,27 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
 import csv
+import json
+import math
+import os
+import queue
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+
+from poi_track import reduction_report, simplify_track, smooth_track, write_csv_track
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+AUTO_EXPR_MAX_KEYFRAMES = 32
 
 
 def build_expr(lines, idx):
@@ -41,6 +60,722 @@ def read_poi(path):
     return rows
 
 
+def parse_track(lines):
+    return [tuple(float(cell) for cell in row) for row in lines]
+
+
+def fmt(value):
+    return f"{value:.10g}"
+
+
+def lerp_expr(a, b, t0, t1):
+    if a == b:
+        return fmt(a)
+    since = f"t+{fmt(-t0)}" if t0 < 0 else f"t-{fmt(t0)}"
+    return f"({fmt(a)}+({fmt(b - a)})*({since})/{fmt(t1 - t0)})"
+
+
+def crop_size(out_size, z):
+    return max(2, int(round(out_size / z / 2.0)) * 2)
+
+
+def center_expr(value_expr, size_var):
+    return f"max(0,min(i{size_var}-o{size_var},{value_expr}-o{size_var}/2))"
+
+
+def sendcmd_events(track, out_w, out_h, zoom_step, target="poi"):
+    # One interval per keyframe segment: x/y get a short lerp expression that
+    # crop evaluates per frame, so per-frame cost does not grow with the track
+    # length. Crop size only changes on commands, so zoom ramps are split into
+    # steps of at most zoom_step pixels. The target is the instance name of
+    # crop@poi: sendcmd does not match "crop@poi", and replies ENOSYS for a
+    # target it does not find. Returns (time, commands) pairs.
+    events = []
+    for (t0, x0, y0, z0), (t1, x1, y1, z1) in zip(track, track[1:]):
+        if t1 <= t0:
+            continue
+        cmds = [
+            f"{target} x '{center_expr(lerp_expr(x0, x1, t0, t1), 'w')}'",
+            f"{target} y '{center_expr(lerp_expr(y0, y1, t0, t1), 'h')}'",
+        ]
+        size_change = abs(out_w / z1 - out_w / z0)
+        steps = max(1, int(math.ceil(size_change / max(zoom_step, 1e-6))))
+        for k in range(steps):
+            ts = t0 + (t1 - t0) * k / steps
+            zm = z0 + (z1 - z0) * (k + 0.5) / steps if steps > 1 else z0
+            size = [f"{target} w {crop_size(out_w, zm)}", f"{target} h {crop_size(out_h, zm)}"]
+            events.append((ts, size + (cmds if k == 0 else [])))
+
+    # Hold the last keyframe instead of extrapolating the last segment.
+    t_end, x_end, y_end, z_end = track[-1]
+    events.append(
+        (
+            t_end,
+            [
+                f"{target} w {crop_size(out_w, z_end)}",
+                f"{target} h {crop_size(out_h, z_end)}",
+                f"{target} x '{center_expr(fmt(x_end), 'w')}'",
+                f"{target} y '{center_expr(fmt(y_end), 'h')}'",
+            ],
+        )
+    )
+    return events
+
+
+def split_events(events, start):
+    # Commands up to start are folded into the initial crop options, keeping
+    # the last value of each: the state a render from the beginning has at
+    # that point. They are not sent as commands on the first frame, because
+    # ffmpeg hangs when crop changes size there and changes it again later.
+    # Returns the initial options and the later (time, commands) pairs.
+    state = {}
+    later = []
+    for ts, cmds in events:
+        if ts > start:
+            later.append((ts, cmds))
+            continue
+        for cmd in cmds:
+            _, option, value = cmd.split(" ", 2)
+            state[option] = value
+    return state, later
+
+
+def format_sendcmd(events):
+    # Microsecond times, the sendcmd resolution; never in exponent notation.
+    return "".join(f"{ts:.6f} " + ", ".join(cmds) + ";\n" for ts, cmds in events)
+
+
+def write_sendcmd(path, track, out_w, out_h, zoom_step, start=0.0):
+    # Frames before the first keyframe hold it, so it is always initial.
+    start = max(start, track[0][0])
+    initial, later = split_events(sendcmd_events(track, out_w, out_h, zoom_step), start)
+    with open(path, "w") as f:
+        f.write(format_sendcmd(later))
+    return initial, bool(later)
+
+
+def filter_path(path):
+    return path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+
+def build_vf_expr(lines, out_w, out_h):
+    # crop evaluates w/h once, before the first frame (t is NAN there), so
+    # the size comes from the zoom of the first keyframe; only x/y follow the
+    # track per frame.
+    expr_cx = build_expr(lines, 0)
+    expr_cy = build_expr(lines, 1)
+    z0 = float(lines[0][3])
+
+    return (
+        f"scale={out_w}:{out_h}:force_original_aspect_ratio=increase,"
+        f"crop="
+        f"w={crop_size(out_w, z0)}:"
+        f"h={crop_size(out_h, z0)}:"
+        f"x='max(0, min(iw-ow, ({expr_cx})-ow/2))':"
+        f"y='max(0, min(ih-oh, ({expr_cy})-oh/2))',"
+        f"scale={out_w}:{out_h}"
+    )
+
+
+def build_vf_sendcmd(initial, out_w, out_h, cmd_file):
+    # setsar=1: with the sample aspect ratio of the crop's changing size,
+    # the final scale stalls the filtergraph after a few resized frames.
+    # sendcmd rejects an empty script, so without commands it is left out.
+    crop = ":".join(f"{option}={initial[option]}" for option in ("w", "h", "x", "y"))
+    sendcmd = f"sendcmd=f='{filter_path(cmd_file)}'," if cmd_file else ""
+    return (
+        f"scale={out_w}:{out_h}:force_original_aspect_ratio=increase,"
+        f"{sendcmd}"
+        f"crop@poi={crop},"
+        f"setsar=1,"
+        f"scale={out_w}:{out_h}"
+    )
+
+
+def probe_video(path):
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height,avg_frame_rate",
+        "-show_entries",
+        "format=duration,start_time",
+        "-of",
+        "json",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.strip()}")
+    data = json.loads(result.stdout)
+    stream = (data.get("streams") or [{}])[0]
+    rate = stream.get("avg_frame_rate") or "0/1"
+    num, _, den = rate.partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+    if not stream.get("width") or not fps:
+        raise RuntimeError(f"No usable video stream in {path}")
+    duration = (data.get("format") or {}).get("duration")
+    start_time = (data.get("format") or {}).get("start_time")
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "rate": rate,
+        "fps": fps,
+        "duration": float(duration) if duration else None,
+        "start_time": float(start_time) if start_time else 0.0,
+    }
+
+
+def cover_size(iw, ih, out_w, out_h):
+    # Same result as scale=out_w:out_h:force_original_aspect_ratio=increase.
+    return max(out_w, int(round(out_h * iw / ih))), max(out_h, int(round(out_w * ih / iw)))
+
+
+def interpolate_track(track, times, ease="linear"):
+    keys = np.asarray(track, dtype=np.float64)
+    kt = keys[:, 0]
+    idx = np.clip(np.searchsorted(kt, times, side="right") - 1, 0, len(kt) - 2)
+    t0 = kt[idx]
+    t1 = kt[idx + 1]
+    u = np.clip((times - t0) / np.where(t1 > t0, t1 - t0, 1.0), 0.0, 1.0)
+    if ease == "smooth":
+        u = u * u * (3.0 - 2.0 * u)
+    a = keys[idx, 1:]
+    b = keys[idx + 1, 1:]
+    return a + (b - a) * u[:, None]
+
+
+def crop_rects(values, src_w, src_h, out_w, out_h):
+    z = np.maximum(values[:, 2], 1e-6)
+    w = np.minimum(out_w / z, src_w)
+    h = np.minimum(out_h / z, src_h)
+    x = np.clip(values[:, 0] - w / 2.0, 0.0, src_w - w)
+    y = np.clip(values[:, 1] - h / 2.0, 0.0, src_h - h)
+    return np.stack([x, y, w, h], axis=1)
+
+
+class FrameCropper:
+    def __init__(self, src_w, src_h, out_w, out_h, interp):
+        self.src_w = src_w
+        self.src_h = src_h
+        self.out_w = out_w
+        self.out_h = out_h
+        self.interp = interp
+        self.cols = np.arange(out_w, dtype=np.float64) + 0.5
+        self.rows = np.arange(out_h, dtype=np.float64) + 0.5
+        self.blend = np.empty((out_h, out_w, 3), dtype=np.float32)
+
+    def crop(self, frame, rect, out):
+        x, y, w, h = rect
+        ix = int(x)
+        iy = int(y)
+        if ix == x and iy == y and round(w) == self.out_w and round(h) == self.out_h:
+            # 1:1 crop: a slice of the decoded frame, copied into the output buffer.
+            out[...] = frame[iy:iy + self.out_h, ix:ix + self.out_w]
+            return out
+        fx = x + self.cols * (w / self.out_w)
+        fy = y + self.rows * (h / self.out_h)
+        if self.interp == "nearest":
+            xi = np.minimum(fx.astype(np.intp), self.src_w - 1)
+            yi = np.minimum(fy.astype(np.intp), self.src_h - 1)
+            np.take(np.take(frame, yi, axis=0), xi, axis=1, out=out, mode="clip")
+            return out
+        fx = np.clip(fx - 0.5, 0.0, self.src_w - 1.0)
+        fy = np.clip(fy - 0.5, 0.0, self.src_h - 1.0)
+        x0 = fx.astype(np.intp)
+        y0 = fy.astype(np.intp)
+        x1 = np.minimum(x0 + 1, self.src_w - 1)
+        y1 = np.minimum(y0 + 1, self.src_h - 1)
+        wx = (fx - x0).astype(np.float32)[None, :, None]
+        wy = (fy - y0).astype(np.float32)[:, None, None]
+        top = np.take(frame, y0, axis=0)
+        bottom = np.take(frame, y1, axis=0)
+        blend = self.blend
+        blend[...] = np.take(top, x0, axis=1) * (1 - wx) + np.take(top, x1, axis=1) * wx
+        blend *= 1 - wy
+        blend += (np.take(bottom, x0, axis=1) * (1 - wx) + np.take(bottom, x1, axis=1) * wx) * wy
+        np.rint(blend, out=blend)
+        out[...] = blend
+        return out
+
+
+def read_exact(stream, buf):
+    view = memoryview(buf).cast("B")
+    got = 0
+    while got < len(view):
+        n = stream.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+
+def run_numpy_engine(inp, track, out_w, out_h, encode_args, ease, interp, depth, limit=None):
+    # decode -> crop -> encode, each stage on its own thread with bounded
+    # queues of reusable frame buffers, so the slowest stage sets the pace.
+    if np is None:
+        raise RuntimeError("--engine numpy needs numpy (pip install numpy)")
+    info = probe_video(inp)
+    src_w, src_h = cover_size(info["width"], info["height"], out_w, out_h)
+    fps = info["fps"]
+    duration = limit or info["duration"] or track[-1][0]
+    count = int(math.ceil(duration * fps)) + 1
+    rects = crop_rects(interpolate_track(track, np.arange(count) / fps, ease), src_w, src_h, out_w, out_h)
+
+    dec_cmd = ["ffmpeg", "-v", "error", "-i", inp]
+    if limit:
+        dec_cmd += ["-t", str(limit)]
+    dec_cmd += ["-vf", f"scale={src_w}:{src_h}", "-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+    enc_cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-y",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{out_w}x{out_h}",
+        "-r",
+        info["rate"],
+        "-i",
+        "-",
+    ] + encode_args
+
+    dec = subprocess.Popen(dec_cmd, stdout=subprocess.PIPE)
+    enc = subprocess.Popen(enc_cmd, stdin=subprocess.PIPE)
+    free_in = queue.Queue()
+    free_out = queue.Queue()
+    for _ in range(depth):
+        free_in.put(np.empty((src_h, src_w, 3), dtype=np.uint8))
+        free_out.put(np.empty((out_h, out_w, 3), dtype=np.uint8))
+    decoded = queue.Queue(maxsize=depth)
+    cropped = queue.Queue(maxsize=depth)
+    errors = []
+
+    def reader():
+        while True:
+            buf = free_in.get()
+            if not read_exact(dec.stdout, buf):
+                break
+            decoded.put(buf)
+        decoded.put(None)
+
+    def writer():
+        while True:
+            buf = cropped.get()
+            if buf is None:
+                break
+            if not errors:
+                try:
+                    enc.stdin.write(memoryview(buf).cast("B"))
+                except (BrokenPipeError, OSError) as exc:
+                    errors.append(exc)
+            free_out.put(buf)
+        try:
+            enc.stdin.close()
+        except OSError:
+            pass
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    cropper = FrameCropper(src_w, src_h, out_w, out_h, interp)
+    frames = 0
+    while True:
+        frame = decoded.get()
+        if frame is None:
+            break
+        rect = rects[min(frames, len(rects) - 1)]
+        out = free_out.get()
+        cropper.crop(frame, rect, out)
+        free_in.put(frame)
+        cropped.put(out)
+        frames += 1
+    cropped.put(None)
+    for thread in threads:
+        thread.join()
+    dec_rc = dec.wait()
+    enc_rc = enc.wait()
+    if errors or dec_rc != 0 or enc_rc != 0:
+        return 1, frames
+    return 0, frames
+
+
+def load_encoders():
+    # The encoder calibration is shared with toweb/snapshot.py; it is only
+    # imported for --venc auto, so an explicit encoder works without toweb.
+    toweb = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toweb"))
+    if not os.path.isfile(os.path.join(toweb, "encoders.py")):
+        raise RuntimeError(
+            f"--venc auto needs {os.path.join(toweb, 'encoders.py')}; name an encoder instead, e.g. --venc libx264"
+        )
+    if toweb not in sys.path:
+        sys.path.append(toweb)
+    import encoders
+
+    return encoders
+
+
+def video_encode_args(args):
+    # An explicit --venc is used as given, with --vb. "auto" takes the fastest
+    # calibrated h264 encoder of this host that meets --min-ssim/--max-bpp.
+    if args.venc != "auto":
+        return ["-c:v", args.venc, "-b:v", args.vb or "20M"]
+    encoders = load_encoders()
+    cache = args.encoder_cache or encoders.DEFAULT_CACHE
+    print(f"Auto encoder: calibration cache {cache}", file=sys.stderr)
+    results = encoders.host_results(cache, args.recalibrate, log=lambda msg: print(msg, file=sys.stderr))
+    choice = encoders.pick(results, "h264", args.min_ssim, args.max_bpp)
+    if choice is not None:
+        print(f"Auto encoder: {encoders.describe(choice)}", file=sys.stderr)
+        return encoders.encoder_args(choice)
+    print("Auto encoder: no calibrated encoder meets the target, using libx264", file=sys.stderr)
+    return ["-c:v", "libx264", "-b:v", args.vb or "20M"]
+
+
+def compare_engines(args, lines, track, out_w, out_h, seconds):
+    null_args = ["-an"] + args.video_args + ["-f", "null", "-"]
+    start = time.monotonic()
+    rc, frames = run_numpy_engine(
+        args.inp, track, out_w, out_h, null_args, args.ease, args.interp, args.queue_depth, seconds
+    )
+    numpy_time = time.monotonic() - start
+    if rc != 0:
+        print("numpy engine failed", file=sys.stderr)
+        return rc
+
+    cmd = ["ffmpeg", "-v", "error", "-y", "-t", str(seconds), "-i", args.inp, "-vf", build_vf_expr(lines, out_w, out_h)]
+    start = time.monotonic()
+    rc = subprocess.call(cmd + null_args)
+    expr_time = time.monotonic() - start
+    if rc != 0:
+        print("expr engine failed", file=sys.stderr)
+        return rc
+
+    print(f"frames: {frames} ({seconds}s of {args.inp}, {len(lines)} keyframes)")
+    for name, elapsed in (("expr", expr_time), ("numpy", numpy_time)):
+        print(f"{name:6s} {elapsed:8.2f}s {frames / elapsed:8.1f} fps")
+    return 0
+
+
+def psnr(a, b):
+    cmd = ["ffmpeg", "-hide_banner", "-i", a, "-i", b, "-lavfi", "[0:v][1:v]psnr", "-f", "null", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"psnr of {a} and {b} failed: {result.stderr.strip()[-300:]}")
+    for line in result.stderr.splitlines():
+        if "PSNR" in line and "average:" in line:
+            value = line.split("average:", 1)[1].split()[0]
+            return float("inf") if value == "inf" else float(value)
+    raise RuntimeError(f"No psnr in the ffmpeg output for {a} and {b}")
+
+
+def check_engines(args, lines, track, out_w, out_h, seconds):
+    # Renders SECONDS of input losslessly with every engine and with a static
+    # crop at the first keyframe. The sendcmd engine must match the numpy
+    # engine (up to resampling) closer than the static crop does, so a track
+    # that silently does not move or zoom fails the check. So must the expr
+    # engine, if auto would pick it for this track.
+    if np is None:
+        raise RuntimeError("--check-engines needs numpy (pip install numpy)")
+    values = interpolate_track(track, np.linspace(0.0, seconds, 64))
+    if np.ptp(values, axis=0).max() == 0:
+        raise RuntimeError(f"The track does not move in the first {seconds}s, nothing to check")
+    _, x0, y0, z0 = track[0]
+    static = (
+        f"scale={out_w}:{out_h}:force_original_aspect_ratio=increase,"
+        f"crop=w={crop_size(out_w, z0)}:h={crop_size(out_h, z0)}:"
+        f"x='{center_expr(fmt(x0), 'w')}':y='{center_expr(fmt(y0), 'h')}',"
+        f"scale={out_w}:{out_h}"
+    )
+    lossless = ["-an", "-c:v", "ffv1"]
+    work = tempfile.mkdtemp(prefix="poi_crop_check_")
+    try:
+        paths = {name: os.path.join(work, f"{name}.mkv") for name in ("numpy", "expr", "sendcmd", "static")}
+        checked = ["sendcmd"]
+        rc, _ = run_numpy_engine(
+            args.inp, track, out_w, out_h, lossless + [paths["numpy"]], "linear", args.interp, args.queue_depth, seconds
+        )
+        if rc != 0:
+            print("numpy engine failed", file=sys.stderr)
+            return rc
+        cmd_file = os.path.join(work, "track.cmd")
+        initial, commands = write_sendcmd(cmd_file, track, out_w, out_h, args.zoom_step)
+        sendcmd = build_vf_sendcmd(initial, out_w, out_h, cmd_file if commands else None)
+        filters = {"sendcmd": sendcmd, "static": static}
+        if choose_engine("auto", lines) == "expr":
+            filters["expr"] = build_vf_expr(lines, out_w, out_h)
+            checked.append("expr")
+        for name, vf in filters.items():
+            cmd = ["ffmpeg", "-v", "error", "-y", "-t", str(seconds), "-i", args.inp, "-vf", vf]
+            rc = subprocess.call(cmd + lossless + [paths[name]])
+            if rc != 0:
+                print(f"{name} engine failed", file=sys.stderr)
+                return rc
+        scores = {name: psnr(paths[name], paths["numpy"]) for name in filters}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"PSNR against the numpy engine ({seconds}s of {args.inp}, {len(lines)} keyframes):")
+    for name, value in scores.items():
+        print(f"  {name:8s} {value:6.2f} dB")
+    if "expr" not in checked:
+        print("  (expr skipped: the track zooms or is too long for it)")
+    failed = [name for name in checked if scores[name] <= scores["static"]]
+    if failed:
+        print(
+            f"{', '.join(failed)}: not closer to the numpy engine than a static crop "
+            "(or the track stays clamped at the frame edges)",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def probe_frames(path):
+    # Presentation times of all video packets and of the keyframes, from the
+    # packet flags (no decode). Both sorted.
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.strip()}")
+    times = []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.strip().partition(",")
+        if pts in ("", "N/A"):
+            continue
+        times.append(float(pts))
+        if "K" in flags:
+            keyframes.append(float(pts))
+    return sorted(times), sorted(keyframes)
+
+
+def count_frames(path):
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-count_packets",
+        "-show_entries",
+        "stream=nb_read_packets",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {path}: {result.stderr.strip()}")
+    return int(result.stdout.strip().split(",")[0])
+
+
+def frame_hashes(path):
+    # MD5 of every decoded video frame, in order.
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-map", "0:v:0", "-f", "framemd5", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"framemd5 failed for {path}: {result.stderr.strip()}")
+    return [line.rsplit(",", 1)[-1].strip() for line in result.stdout.splitlines() if line and line[0] != "#"]
+
+
+def chunk_starts(keyframes, duration, chunks):
+    # Split points: the keyframe nearest to each 1/chunks of the duration.
+    starts = [0.0]
+    for k in range(1, chunks):
+        target = duration * k / chunks
+        idx = bisect.bisect_left(keyframes, target)
+        near = keyframes[max(0, idx - 1):idx + 1]
+        if near:
+            best = min(near, key=lambda t: abs(t - target))
+            if best > starts[-1]:
+                starts.append(best)
+    return starts
+
+
+def chunk_track(track, start, end):
+    # Keyframes of the segments overlapping [start, end). Whole segments are
+    # kept, so the interpolation and the sendcmd zoom steps match the serial
+    # render.
+    times = [row[0] for row in track]
+    lo = max(0, bisect.bisect_right(times, start) - 1)
+    hi = len(track) - 1 if end is None else min(len(track) - 1, bisect.bisect_left(times, end))
+    lo = max(0, min(lo, hi - 1))
+    hi = max(hi, lo + 1)
+    return track[lo:hi + 1]
+
+
+def concat_line(path):
+    return "file '" + path.replace("'", "'\\''") + "'"
+
+
+def run_chunked(args, track, out_w, out_h, engine):
+    # Split at keyframes, render the chunks in parallel processes, then join
+    # them with the concat demuxer and copy the audio of the input in one pass.
+    info = probe_video(args.inp)
+    if not info["duration"]:
+        raise RuntimeError(f"Unknown duration of {args.inp}, cannot split it")
+    times, keyframes = probe_frames(args.inp)
+    times = [t - info["start_time"] for t in times]
+    keyframes = [t - info["start_time"] for t in keyframes]
+    starts = chunk_starts(keyframes, info["duration"], args.chunks)
+    # Each chunk is cut by frame count from the probed packet times, so the
+    # chunks add up to the input frame by frame. The seek is half a frame
+    # early, so the keyframe is kept even if its printed pts is rounded up.
+    # The first setpts gives the frames the timestamps of a serial render, so
+    # the track expressions and sendcmd times are evaluated on exactly the
+    # same values; the last one starts the chunk at 0 for the concat.
+    half = 0.5 / info["fps"]
+    firsts = [0] + [bisect.bisect_left(times, t - half) for t in starts[1:]] + [len(times)]
+    print(f"chunks: {len(starts)} starting at " + ", ".join(f"{t:.3f}s" for t in starts), file=sys.stderr)
+
+    threads = max(1, (os.cpu_count() or 1) // len(starts))
+    ext = os.path.splitext(args.out)[1] or ".mp4"
+    work = tempfile.mkdtemp(prefix="poi_crop_chunks_", dir=os.path.dirname(os.path.abspath(args.out)))
+    try:
+        cmds = []
+        paths = []
+        for idx, start in enumerate(starts):
+            first = times[firsts[idx]]
+            end = times[firsts[idx + 1]] if idx + 1 < len(starts) else None
+            local = chunk_track(track, first, end)
+            if engine == "sendcmd":
+                cmd_file = os.path.join(work, f"chunk_{idx:03d}.cmd")
+                # Starts with the crop a serial render has at the first frame.
+                initial, commands = write_sendcmd(cmd_file, local, out_w, out_h, args.zoom_step, first)
+                vf = build_vf_sendcmd(initial, out_w, out_h, cmd_file if commands else None)
+            else:
+                vf = build_vf_expr([[fmt(v) for v in row] for row in local], out_w, out_h)
+            path = os.path.join(work, f"chunk_{idx:03d}{ext}")
+            cmd = ["ffmpeg", "-hide_banner", "-v", "error", "-y"]
+            if idx:
+                cmd += ["-ss", fmt(start - half)]
+            vf = f"setpts=PTS-STARTPTS+round({fmt(first)}/TB),{vf},setpts=PTS-STARTPTS"
+            cmd += ["-i", args.inp, "-an", "-vf", vf]
+            cmd += ["-frames:v", str(firsts[idx + 1] - firsts[idx])]
+            cmd += args.video_args + ["-threads", str(threads), path]
+            cmds.append(cmd)
+            paths.append(path)
+
+        procs = [subprocess.Popen(cmd) for cmd in cmds]
+        failed = [idx for idx, proc in enumerate(procs) if proc.wait() != 0]
+        if failed:
+            print(f"chunk encode failed: {', '.join(str(idx) for idx in failed)}", file=sys.stderr)
+            return 1
+
+        list_file = os.path.join(work, "chunks.txt")
+        with open(list_file, "w") as f:
+            f.write("\n".join(concat_line(path) for path in paths) + "\n")
+        cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-y",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            list_file,
+            "-i",
+            args.inp,
+            "-map",
+            "0:v",
+            "-map",
+            "1:a:0?",
+            "-c",
+            "copy",
+            args.out,
+        ]
+        rc = subprocess.call(cmd)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if rc != 0:
+        return rc
+    frames = count_frames(args.out)
+    if frames != len(times):
+        print(f"chunked output has {frames} frames, the input {len(times)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def verify_chunked(args, lines, out_w, out_h, engine):
+    # Renders the input serially next to the output and compares the decoded
+    # frames. Only meaningful with a lossless --venc.
+    root, ext = os.path.splitext(args.out)
+    serial = f"{root}.serial{ext}"
+    try:
+        rc = run_serial(args, lines, out_w, out_h, engine, serial)
+        if rc != 0:
+            print("serial render for --verify-chunks failed", file=sys.stderr)
+            return rc
+        chunked = frame_hashes(args.out)
+        expected = frame_hashes(serial)
+    finally:
+        if os.path.exists(serial):
+            os.remove(serial)
+    if chunked == expected:
+        print(f"verify: {len(chunked)} frames identical to the serial render", file=sys.stderr)
+        return 0
+    diff = next((n for n, (a, b) in enumerate(zip(chunked, expected)) if a != b), min(len(chunked), len(expected)))
+    print(
+        f"verify: chunked output differs from the serial render from frame {diff} "
+        f"({len(chunked)} vs {len(expected)} frames)",
+        file=sys.stderr,
+    )
+    return 1
+
+
+def run_serial(args, lines, out_w, out_h, engine, out):
+    cmd_file = args.cmd_file
+    if engine == "sendcmd":
+        track = sorted(parse_track(lines))
+        if cmd_file is None:
+            fd, cmd_file = tempfile.mkstemp(prefix="poi_crop_", suffix=".cmd")
+            os.close(fd)
+        initial, commands = write_sendcmd(cmd_file, track, out_w, out_h, args.zoom_step)
+        vf = build_vf_sendcmd(initial, out_w, out_h, cmd_file if commands else None)
+    else:
+        vf = build_vf_expr(lines, out_w, out_h)
+
+    cmd = ["ffmpeg", "-hide_banner", "-y", "-i", args.inp, "-vf", vf] + args.video_args + ["-c:a", "copy", out]
+    try:
+        return subprocess.call(cmd)
+    finally:
+        if engine == "sendcmd" and args.cmd_file is None:
+            os.remove(cmd_file)
+
+
+def track_zooms(track):
+    return len({row[3] for row in track}) > 1
+
+
+def choose_engine(engine, lines):
+    # expr cannot zoom (crop evaluates w/h once), so zooming tracks go to
+    # sendcmd.
+    if engine != "auto":
+        return engine
+    if len(lines) > AUTO_EXPR_MAX_KEYFRAMES or track_zooms(parse_track(lines)):
+        return "sendcmd"
+    return "expr"
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Reframe/crop a video using POI keyframes from poi.csv."
@@ -50,8 +785,97 @@ def main():
     parser.add_argument("--out", dest="out", default="out_reframe.mp4")
     parser.add_argument("--out-w", dest="out_w", default="1920")
     parser.add_argument("--out-h", dest="out_h", default="1080")
-    parser.add_argument("--venc", dest="venc", default="h264_videotoolbox")
-    parser.add_argument("--vb", dest="vb", default="20M")
+    parser.add_argument(
+        "--venc",
+        dest="venc",
+        default="auto",
+        help="Video encoder, e.g. libx264 or h264_videotoolbox (auto: fastest calibrated encoder of this host)",
+    )
+    parser.add_argument("--vb", dest="vb", default=None, help="Video bitrate with an explicit --venc (default 20M)")
+    parser.add_argument("--min-ssim", dest="min_ssim", type=float, default=0.98, help="Quality target of --venc auto")
+    parser.add_argument(
+        "--max-bpp", dest="max_bpp", type=float, default=None, help="Size target of --venc auto (bits per pixel)"
+    )
+    parser.add_argument(
+        "--encoder-cache",
+        dest="encoder_cache",
+        default=None,
+        help="Per-host encoder calibration cache of --venc auto (default: ~/.cache/toweb/encoders.json)",
+    )
+    parser.add_argument("--recalibrate", action="store_true", help="Re-run the encoder calibration")
+    parser.add_argument(
+        "--engine",
+        choices=("auto", "expr", "sendcmd", "numpy"),
+        default="auto",
+        help="POI track engine: nested if() expressions, a sendcmd script or a numpy frame pipeline "
+        "(auto: expr for short tracks without zoom, else sendcmd)",
+    )
+    parser.add_argument(
+        "--ease",
+        choices=("linear", "smooth"),
+        default="linear",
+        help="Interpolation between keyframes (numpy engine)",
+    )
+    parser.add_argument(
+        "--interp",
+        choices=("nearest", "bilinear"),
+        default="nearest",
+        help="Pixel resampling; bilinear gives subpixel crop motion (numpy engine)",
+    )
+    parser.add_argument("--queue-depth", dest="queue_depth", type=int, default=8, help="Frames buffered per stage")
+    parser.add_argument(
+        "--compare",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Encode SECONDS of input to a null output with the expr and numpy engines and print throughput",
+    )
+    parser.add_argument(
+        "--check-engines",
+        dest="check_engines",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Render SECONDS of input losslessly with every engine and check that the expr and sendcmd "
+        "output follows the numpy engine, not a static crop",
+    )
+    parser.add_argument(
+        "--zoom-step",
+        dest="zoom_step",
+        type=float,
+        default=2.0,
+        help="Max crop size change in pixels between zoom steps (sendcmd engine)",
+    )
+    parser.add_argument("--cmd-file", dest="cmd_file", default=None, help="Keep the sendcmd script at this path")
+    parser.add_argument("--smooth", type=float, default=0.0, help="Smooth the track over +-SECONDS (0 = off)")
+    parser.add_argument(
+        "--simplify",
+        type=float,
+        default=None,
+        metavar="PX",
+        help="Drop keyframes that linear interpolation reproduces within PX pixels",
+    )
+    parser.add_argument(
+        "--simplify-zoom",
+        dest="simplify_zoom",
+        type=float,
+        default=0.01,
+        help="Allowed zoom error for --simplify",
+    )
+    parser.add_argument("--save-poi", dest="save_poi", default=None, help="Write the processed track to this csv")
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=1,
+        help="Split the input at keyframes into this many chunks and encode them in parallel (expr/sendcmd engines)",
+    )
+    parser.add_argument(
+        "--verify-chunks",
+        dest="verify_chunks",
+        action="store_true",
+        help="After --chunks, render serially too and compare every decoded frame (needs a lossless --venc, "
+        "e.g. ffv1 with an .mkv --out)",
+    )
     args = parser.parse_args()
 
     lines = read_poi(args.poi)
@@ -59,37 +883,68 @@ def main():
         print("poi.csv must contain at least 2 data rows", file=sys.stderr)
         return 1
 
-    expr_cx = build_expr(lines, 0)
-    expr_cy = build_expr(lines, 1)
-    expr_z = build_expr(lines, 2)
+    if args.smooth > 0 or args.simplify is not None:
+        track = smooth_track(sorted(parse_track(lines)), args.smooth)
+        if args.simplify is not None:
+            track = [track[k] for k in simplify_track(track, args.simplify, args.simplify_zoom)]
+            print(reduction_report(len(lines), len(track)))
+        lines = [[fmt(v) for v in row] for row in track]
+    if args.save_poi:
+        write_csv_track(args.save_poi, parse_track(lines))
 
-    vf = (
-        f"scale={args.out_w}:{args.out_h}:force_original_aspect_ratio=increase,"
-        f"crop="
-        f"w='{args.out_w}/({expr_z})':"
-        f"h='{args.out_h}/({expr_z})':"
-        f"x='max(0, min(iw-ow, ({expr_cx})-ow/2))':"
-        f"y='max(0, min(ih-oh, ({expr_cy})-oh/2))',"
-        f"scale={args.out_w}:{args.out_h}"
-    )
+    out_w = int(args.out_w)
+    out_h = int(args.out_h)
+    engine = choose_engine(args.engine, lines)
+    if engine == "expr" and track_zooms(parse_track(lines)):
+        print("expr engine: crop sets its size once, the zoom of the track is ignored", file=sys.stderr)
+    try:
+        args.video_args = video_encode_args(args)
+    except RuntimeError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
 
-    cmd = [
-        "ffmpeg",
-        "-hide_banner",
-        "-y",
-        "-i",
-        args.inp,
-        "-vf",
-        vf,
-        "-c:v",
-        args.venc,
-        "-b:v",
-        args.vb,
-        "-c:a",
-        "copy",
-        args.out,
-    ]
-    return subprocess.call(cmd)
+    if args.check_engines:
+        try:
+            return check_engines(args, lines, sorted(parse_track(lines)), out_w, out_h, args.check_engines)
+        except RuntimeError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+
+    if args.chunks > 1 and not args.compare:
+        if engine == "numpy":
+            print("--chunks works with the expr and sendcmd engines", file=sys.stderr)
+            return 1
+        try:
+            rc = run_chunked(args, sorted(parse_track(lines)), out_w, out_h, engine)
+            if rc == 0 and args.verify_chunks:
+                rc = verify_chunked(args, lines, out_w, out_h, engine)
+            return rc
+        except RuntimeError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+
+    if args.compare or engine == "numpy":
+        track = sorted(parse_track(lines))
+        try:
+            if args.compare:
+                return compare_engines(args, lines, track, out_w, out_h, args.compare)
+            encode = ["-i", args.inp, "-map", "0:v", "-map", "1:a?"] + args.video_args
+            rc, _ = run_numpy_engine(
+                args.inp,
+                track,
+                out_w,
+                out_h,
+                encode + ["-c:a", "copy", args.out],
+                args.ease,
+                args.interp,
+                args.queue_depth,
+            )
+            return rc
+        except RuntimeError as exc:
+            print(str(exc), file=sys.stderr)
+            return 1
+
+    return run_serial(args, lines, out_w, out_h, engine, args.out)
 
 
 if __name__ == "__main__":
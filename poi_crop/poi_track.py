@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import csv
+import math
+import sqlite3
+import sys
+
+
+def smooth_track(track, window):
+    # Centered moving average over +-window seconds. The window shrinks near
+    # both ends so the first and last keyframes stay where they are.
+    if window <= 0 or len(track) < 3:
+        return list(track)
+    ts = [row[0] for row in track]
+    sums = [[0.0, 0.0, 0.0]]
+    for row in track:
+        last = sums[-1]
+        sums.append([last[0] + row[1], last[1] + row[2], last[2] + row[3]])
+    first_t = ts[0]
+    last_t = ts[-1]
+    out = []
+    for t in ts:
+        half = min(window, t - first_t, last_t - t)
+        lo = bisect.bisect_left(ts, t - half)
+        hi = bisect.bisect_right(ts, t + half)
+        n = hi - lo
+        out.append((t,) + tuple((sums[hi][k] - sums[lo][k]) / n for k in range(3)))
+    return out
+
+
+def segment_error(track, i, j, px_tol, zoom_tol):
+    # Worst keyframe between i and j, measured against the straight-line
+    # interpolation ffmpeg would do if only i and j were kept.
+    t0, x0, y0, z0 = track[i]
+    t1, x1, y1, z1 = track[j]
+    span = t1 - t0
+    worst = 0.0
+    worst_k = None
+    for k in range(i + 1, j):
+        t, x, y, z = track[k]
+        u = (t - t0) / span if span > 0 else 0.0
+        dist = math.hypot(x - (x0 + (x1 - x0) * u), y - (y0 + (y1 - y0) * u))
+        err = max(dist / px_tol, abs(z - (z0 + (z1 - z0) * u)) / zoom_tol)
+        if err > worst:
+            worst = err
+            worst_k = k
+    return worst, worst_k
+
+
+def simplify_track(track, px_tol, zoom_tol, keep=()):
+    # Ramer-Douglas-Peucker over time: returns the sorted indices of the
+    # keyframes to keep. Indices in `keep` are never dropped.
+    n = len(track)
+    if n < 3:
+        return list(range(n))
+    px_tol = max(px_tol, 1e-9)
+    zoom_tol = max(zoom_tol, 1e-9)
+    kept = {0, n - 1} | {k for k in keep if 0 <= k < n}
+    anchors = sorted(kept)
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        err, k = segment_error(track, i, j, px_tol, zoom_tol)
+        if err > 1.0:
+            kept.add(k)
+            stack.append((i, k))
+            stack.append((k, j))
+    return sorted(kept)
+
+
+def reduction_report(before, after):
+    ratio = after / before if before else 1.0
+    return f"POI track: {before} -> {after} keyframes ({ratio:.1%})"
+
+
+def read_csv_track(path):
+    track = []
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row or all(not cell.strip() for cell in row):
+                continue
+            if len(row) < 4:
+                raise ValueError("poi.csv rows must be: t,x,y,z")
+            track.append(tuple(float(cell) for cell in row[:4]))
+    return sorted(track)
+
+
+def write_csv_track(path, track):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["t", "x", "y", "z"])
+        for row in track:
+            writer.writerow([f"{v:.6g}" for v in row])
+
+
+def load_db_track(conn, media_id):
+    # POI rows of one media file, plus the ids referenced by edit points
+    # (those POIs drive their own outputs and must survive a reduction).
+    rows = conn.execute(
+        "SELECT id, t, x, y, COALESCE(z, 1.0) FROM poi WHERE media_id = ? AND t IS NOT NULL ORDER BY t, id",
+        (media_id,),
+    ).fetchall()
+    pinned = {
+        row[0]
+        for row in conn.execute(
+            "SELECT DISTINCT poi_id FROM edit_point WHERE original_media_id = ? AND poi_id IS NOT NULL",
+            (media_id,),
+        )
+    }
+    return [row[0] for row in rows], [tuple(row[1:]) for row in rows], pinned
+
+
+def write_db_track(conn, ids, track, kept):
+    # Update kept rows in place (smoothing may have moved them) and delete
+    # the rest; the schema triggers mark the affected outputs dirty.
+    kept_set = set(kept)
+    conn.executemany(
+        "UPDATE poi SET x = ?, y = ?, z = ? WHERE id = ? AND (x IS NOT ? OR y IS NOT ? OR z IS NOT ?)",
+        [track[k][1:] + (ids[k],) + track[k][1:] for k in kept],
+    )
+    conn.executemany(
+        "DELETE FROM poi WHERE id = ?",
+        [(poi_id,) for k, poi_id in enumerate(ids) if k not in kept_set],
+    )
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smooth and reduce POI keyframe tracks.")
+    parser.add_argument("--poi", default=None, help="Read the track from this poi.csv")
+    parser.add_argument("--db", default=None, help="Read the track from the poi table of a toweb.db")
+    parser.add_argument("--media-id", dest="media_id", type=int, default=None)
+    parser.add_argument("--out", default=None, help="Write the reduced track to this csv")
+    parser.add_argument("--write", action="store_true", help="Write the reduced track back to the database")
+    parser.add_argument("--smooth", type=float, default=0.0, help="Moving average window in seconds (0 = off)")
+    parser.add_argument("--tol-px", dest="tol_px", type=float, default=2.0, help="Allowed position error in pixels")
+    parser.add_argument("--tol-zoom", dest="tol_zoom", type=float, default=0.01, help="Allowed zoom error")
+    args = parser.parse_args()
+
+    if bool(args.poi) == bool(args.db):
+        print("Use exactly one of --poi or --db.", file=sys.stderr)
+        return 1
+    if args.db and args.media_id is None:
+        print("--db needs --media-id.", file=sys.stderr)
+        return 1
+
+    conn = None
+    ids = None
+    keep = ()
+    if args.db:
+        conn = sqlite3.connect(args.db)
+        try:
+            ids, track, pinned = load_db_track(conn, args.media_id)
+        except sqlite3.OperationalError as exc:
+            print(f"Cannot read poi table: {exc}", file=sys.stderr)
+            return 1
+        keep = [k for k, poi_id in enumerate(ids) if poi_id in pinned]
+    else:
+        track = read_csv_track(args.poi)
+
+    if not track:
+        print("No POI keyframes found.", file=sys.stderr)
+        return 1
+
+    smoothed = smooth_track(track, args.smooth)
+    for k in keep:
+        smoothed[k] = track[k]
+    track = smoothed
+    kept = simplify_track(track, args.tol_px, args.tol_zoom, keep)
+    print(reduction_report(len(track), len(kept)))
+
+    if args.out:
+        write_csv_track(args.out, [track[k] for k in kept])
+    if args.write:
+        if conn is None:
+            print("--write needs --db.", file=sys.stderr)
+            return 1
+        write_db_track(conn, ids, track, kept)
+    if conn is not None:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import time
+from types import SimpleNamespace
+
+import create_db
+import snapshot
+
+
+# Encoder settings for the synthetic originals, keyed by --codec.
+SOURCE_CODECS = {
+    "h264": ["-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p"],
+    "hevc": ["-c:v", "libx265", "-preset", "ultrafast", "-pix_fmt", "yuv420p"],
+    "prores": ["-c:v", "prores_ks", "-profile:v", "1", "-pix_fmt", "yuv422p10le"],
+    "mjpeg": ["-c:v", "mjpeg", "-q:v", "3", "-pix_fmt", "yuvj422p"],
+}
+
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return result.stdout.split("\n", 1)[0] or None
+
+
+def make_source(path, width, height, fps, duration, codec):
+    # One synthetic clip per configuration; reused across runs.
+    if os.path.exists(path):
+        return True
+    tmp = f"{path}.tmp.mov"
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-v",
+        "error",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={duration}",
+    ] + SOURCE_CODECS[codec] + ["-c:a", "aac", "-shortest", tmp]
+    if subprocess.call(cmd) != 0:
+        return False
+    os.replace(tmp, path)
+    return True
+
+
+def link_originals(source, media_dir, count):
+    # Hard links keep the disk use of one clip, but every original still has
+    # its own path and is probed and fingerprinted on its own.
+    os.makedirs(media_dir, exist_ok=True)
+    paths = []
+    for idx in range(1, count + 1):
+        path = os.path.join(media_dir, f"bench_{idx:04d}.mov")
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        paths.append(os.path.relpath(path, os.path.dirname(media_dir)))
+    return paths
+
+
+def seed_bench(conn, paths, args):
+    cur = conn.cursor()
+    cur.execute("INSERT INTO camera (name, note) VALUES (?, ?)", ("Bench", "Synthetic benchmark camera"))
+    cam_id = cur.lastrowid
+    for n, path in enumerate(paths):
+        # Format fields and raw_mtime stay NULL so the probe phase has work to do.
+        cur.execute("INSERT INTO media_file (path, kind, note) VALUES (?, 'original', ?)", (path, "Benchmark"))
+        orig_id = cur.lastrowid
+        label = os.path.splitext(os.path.basename(path))[0]
+        cur.execute(
+            """
+            INSERT INTO media_file
+              (parent_id, path, kind, width, height, frame_rate, codec, cfg_start, cfg_max_duration)
+            VALUES (?, ?, 'snapshot_base', ?, ?, ?, 'h264', ?, ?)
+            """,
+            (orig_id, f"out/{label}_base.mp4", args.out_w, args.out_h, args.fps, 0.0, args.clip),
+        )
+        cur.execute(
+            "INSERT INTO edit_point (original_media_id, output_media_id, camera_id) VALUES (?, ?, ?)",
+            (orig_id, cur.lastrowid, cam_id),
+        )
+        for idx in range(args.pois):
+            t = (idx + 0.5) * args.duration / max(args.pois, 1)
+            x = args.width * (0.25 + 0.5 * ((idx * 7 + n) % 10) / 10.0)
+            y = args.height * (0.25 + 0.5 * ((idx * 3 + n) % 10) / 10.0)
+            cur.execute(
+                "INSERT INTO poi (media_id, t, x, y, z, default_camera_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (orig_id, t, x, y, 1.5, cam_id),
+            )
+            poi_id = cur.lastrowid
+            cur.execute(
+                """
+                INSERT INTO media_file
+                  (parent_id, path, kind, width, height, frame_rate, codec, cfg_max_duration)
+                VALUES (?, ?, 'snapshot_poi', ?, ?, ?, 'h264', ?)
+                """,
+                (orig_id, f"out/{label}_poi_{idx + 1}.mp4", args.out_w, args.out_h, args.fps, args.clip),
+            )
+            cur.execute(
+                """
+                INSERT INTO edit_point
+                  (original_media_id, output_media_id, poi_id, camera_id, poi_t, poi_x, poi_y, poi_z)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (orig_id, cur.lastrowid, poi_id, cam_id, t, x, y, 1.5),
+            )
+    conn.commit()
+
+
+def spread(values):
+    if not values:
+        return None
+    return {
+        "min": round(min(values), 4),
+        "median": round(statistics.median(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark snapshot.py on synthetic media.")
+    parser.add_argument("--work-dir", default="bench_work", help="Scratch folder (media, outputs, bench.db)")
+    parser.add_argument("--originals", type=int, default=4)
+    parser.add_argument("--pois", type=int, default=2, help="POI outputs per original")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--duration", type=float, default=10.0, help="Length of the synthetic originals (seconds)")
+    parser.add_argument("--codec", choices=sorted(SOURCE_CODECS), default="h264")
+    parser.add_argument("--clip", type=float, default=3.0, help="Length of each output (seconds)")
+    parser.add_argument("--out-w", type=int, default=320)
+    parser.add_argument("--out-h", type=int, default=180)
+    parser.add_argument("--single-decode", action="store_true")
+    parser.add_argument("--keyframe-index", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--threads-per-job", type=int, default=None)
+    parser.add_argument("--probe-jobs", type=int, default=4)
+    parser.add_argument("--json", default=None, help="Write the result here (default: <work-dir>/bench_result.json)")
+    args = parser.parse_args()
+
+    if args.jobs < 1 or args.originals < 1:
+        print("--jobs and --originals must be at least 1")
+        return 1
+
+    work = os.path.abspath(args.work_dir)
+    media_dir = os.path.join(work, "media")
+    os.makedirs(media_dir, exist_ok=True)
+    source = os.path.join(
+        work, f"source_{args.width}x{args.height}_{args.fps}_{args.codec}_{args.duration:g}s.mov"
+    )
+
+    start = time.monotonic()
+    if not make_source(source, args.width, args.height, args.fps, args.duration, args.codec):
+        print("Could not generate the synthetic source (is ffmpeg with lavfi on PATH?)")
+        return 1
+    generate_s = time.monotonic() - start
+
+    db_path = os.path.join(work, "bench.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    shutil.rmtree(os.path.join(work, "out"), ignore_errors=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    create_db.create_schema(conn)
+    seed_bench(conn, link_originals(source, media_dir, args.originals), args)
+    conn.close()
+
+    run_args = SimpleNamespace(
+        out_w=None,
+        out_h=None,
+        duration=None,
+        probe_jobs=args.probe_jobs,
+        single_decode=args.single_decode,
+        keyframe_index=args.keyframe_index,
+        jobs=args.jobs,
+        threads_per_job=args.threads_per_job,
+        force=False,
+        dry_run=False,
+    )
+    threads = snapshot.threads_per_job(run_args)
+    conn = snapshot.connect_db(db_path)
+    snapshot.ensure_schema(conn)
+
+    start = time.monotonic()
+    probed = snapshot.refresh_originals(conn, work, snapshot.ORIGINALS_SQL, args.probe_jobs, force_probe=True)
+    probe_s = time.monotonic() - start
+
+    start = time.monotonic()
+    planned = snapshot.plan_originals(conn, work, work, run_args)
+    plan_s = time.monotonic() - start
+
+    timings = []
+    start = time.monotonic()
+    snapshot.render_plan(conn, planned, run_args, threads, timings)
+    render_s = time.monotonic() - start
+    conn.close()
+
+    # A single-decode task renders several outputs; its time is split evenly.
+    per_output = []
+    media_seconds = 0.0
+    ok_count = 0
+    for task in timings:
+        jobs = task["jobs"]
+        per_output += [task["seconds"] / len(jobs)] * len(jobs)
+        for job in jobs:
+            if job["out_id"] in task["ok_ids"]:
+                ok_count += 1
+                media_seconds += job["duration"] or args.duration
+    outputs = sum(len(jobs) for _, _, jobs, _ in planned)
+
+    result = {
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "ffmpeg": ffmpeg_version(),
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "originals", "pois", "width", "height", "fps", "duration", "codec", "clip",
+                "out_w", "out_h", "single_decode", "keyframe_index", "jobs", "threads_per_job", "probe_jobs",
+            )
+        },
+        "generate_s": round(generate_s, 4),
+        "probe_s": round(probe_s, 4),
+        "probed": {"originals": probed[0], "cached": probed[1], "probed": probed[2]},
+        "plan_s": round(plan_s, 4),
+        "render_s": round(render_s, 4),
+        "tasks": len(timings),
+        "outputs": outputs,
+        "outputs_ok": ok_count,
+        "encode_s_per_output": spread(per_output),
+        "outputs_per_s": round(ok_count / render_s, 4) if render_s else None,
+        "realtime_factor": round(media_seconds / render_s, 4) if render_s else None,
+    }
+    text = json.dumps(result, indent=2)
+    with open(args.json or os.path.join(work, "bench_result.json"), "w") as f:
+        f.write(text + "\n")
+    print(text)
+    return 0 if ok_count == outputs else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -33,6 +33,7 @@ CREATE TABLE IF NOT EXISTS media_file (
   raw_mtime TEXT,
   poi_mtime TEXT,
   conv_mtime TEXT,
+  marker_mtime TEXT,
   note TEXT
 );
 
@@ -75,8 +76,287 @@ CREATE TABLE IF NOT EXISTS marker (
   type TEXT NOT NULL,
   text TEXT
 );
+
+CREATE TABLE IF NOT EXISTS render_job (
+  id INTEGER PRIMARY KEY,
+  original_media_id INTEGER NOT NULL REFERENCES media_file(id),
+  output_media_id INTEGER NOT NULL REFERENCES media_file(id),
+  state TEXT NOT NULL DEFAULT 'queued',
+  plan_mtime TEXT NOT NULL,
+  worker TEXT,
+  lease_until REAL,
+  heartbeat_at REAL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  error TEXT,
+  created_at TEXT NOT NULL,
+  finished_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS probe_cache (
+  path TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  inode INTEGER NOT NULL,
+  width INTEGER,
+  height INTEGER,
+  frame_rate REAL,
+  codec TEXT,
+  duration REAL,
+  start_time REAL,
+  probed_at TEXT NOT NULL,
+  PRIMARY KEY (path, size, mtime_ns, inode)
+);
+
+CREATE TABLE IF NOT EXISTS keyframe_index (
+  path TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  inode INTEGER NOT NULL,
+  keyframes TEXT NOT NULL,
+  packets INTEGER NOT NULL,
+  indexed_at TEXT NOT NULL,
+  PRIMARY KEY (path, size, mtime_ns, inode)
+);
+
+CREATE TABLE IF NOT EXISTS proxy_file (
+  media_id INTEGER PRIMARY KEY REFERENCES media_file(id),
+  path TEXT NOT NULL,
+  width INTEGER NOT NULL,
+  height INTEGER NOT NULL,
+  codec TEXT NOT NULL,
+  raw_mtime TEXT,
+  created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS render_manifest (
+  output_media_id INTEGER PRIMARY KEY REFERENCES media_file(id),
+  fingerprint TEXT NOT NULL,
+  source_hash TEXT NOT NULL,
+  args TEXT NOT NULL,
+  rendered_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dirty_output (
+  output_media_id INTEGER PRIMARY KEY REFERENCES media_file(id),
+  original_media_id INTEGER NOT NULL REFERENCES media_file(id),
+  reason TEXT,
+  queued_at TEXT NOT NULL,
+  seq INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS corrupt_frame (
+  id INTEGER PRIMARY KEY,
+  media_id INTEGER NOT NULL REFERENCES media_file(id),
+  t REAL NOT NULL,
+  frame INTEGER,
+  message TEXT,
+  scanned_at TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS render_job_active
+  ON render_job(output_media_id) WHERE state IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS render_job_state ON render_job(state, lease_until);
+CREATE INDEX IF NOT EXISTS render_job_original ON render_job(original_media_id, plan_mtime);
 """
 
+# Columns added after the first schema version: (table, column, type, backfill
+# run once when the column is added to an existing database).
+ADDED_COLUMNS = [
+    (
+        "media_file",
+        "marker_mtime",
+        "TEXT",
+        "UPDATE media_file SET marker_mtime = {now} WHERE id IN (SELECT media_id FROM marker)",
+    ),
+]
+
+# Julian-day copies of the ISO 8601 timestamps. SQLite parses "Z" and "+hh:mm"
+# suffixes, so PHP-written values in any offset compare and sort correctly.
+GENERATED_COLUMNS = [
+    ("media_file", "raw_mtime_jd", "julianday(raw_mtime)"),
+    ("media_file", "poi_mtime_jd", "julianday(poi_mtime)"),
+    ("media_file", "conv_mtime_jd", "julianday(conv_mtime)"),
+    ("media_file", "marker_mtime_jd", "julianday(marker_mtime)"),
+    ("poi", "updated_jd", "julianday(updated_at)"),
+]
+
+INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS media_file_parent ON media_file(parent_id, kind);
+CREATE INDEX IF NOT EXISTS poi_media ON poi(media_id, updated_jd);
+CREATE INDEX IF NOT EXISTS edit_point_original ON edit_point(original_media_id);
+CREATE INDEX IF NOT EXISTS edit_point_output ON edit_point(output_media_id);
+CREATE INDEX IF NOT EXISTS edit_point_poi ON edit_point(poi_id);
+CREATE INDEX IF NOT EXISTS marker_media ON marker(media_id, t);
+CREATE INDEX IF NOT EXISTS corrupt_frame_media ON corrupt_frame(media_id, t);
+"""
+
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
+
+# Triggers keep poi_mtime and marker_mtime current and push affected outputs into dirty_output,
+# so edits from any client (PHP included) enqueue work. seq is bumped on every
+# re-dirty; snapshot.py only clears an entry if seq is unchanged since it
+# planned the render.
+DIRTY_UPSERT = f"""
+  ON CONFLICT(output_media_id) DO UPDATE
+  SET seq = seq + 1, reason = excluded.reason, queued_at = {NOW_SQL}
+"""
+
+TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS poi_insert_mtime AFTER INSERT ON poi
+BEGIN
+  UPDATE media_file SET poi_mtime = {NOW_SQL} WHERE id = NEW.media_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS poi_delete_mtime AFTER DELETE ON poi
+BEGIN
+  UPDATE media_file SET poi_mtime = {NOW_SQL} WHERE id = OLD.media_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS poi_move_mtime AFTER UPDATE OF media_id ON poi
+WHEN NEW.media_id IS NOT OLD.media_id
+BEGIN
+  UPDATE media_file SET poi_mtime = {NOW_SQL} WHERE id IN (OLD.media_id, NEW.media_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS poi_touch AFTER UPDATE OF t, x, y, z, distance, default_camera_id ON poi
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+  UPDATE poi SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS poi_update_dirty AFTER UPDATE OF t, x, y, z, distance, updated_at ON poi
+BEGIN
+  UPDATE edit_point
+  SET poi_t = NEW.t, poi_x = NEW.x, poi_y = NEW.y, poi_z = NEW.z, poi_distance = NEW.distance
+  WHERE poi_id = NEW.id;
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT output_media_id, original_media_id, 'poi', {NOW_SQL}
+  FROM edit_point WHERE poi_id = NEW.id
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS media_poi_mtime_dirty AFTER UPDATE OF poi_mtime ON media_file
+WHEN NEW.poi_mtime IS NOT OLD.poi_mtime
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT ep.output_media_id, ep.original_media_id, 'poi_mtime', {NOW_SQL}
+  FROM edit_point ep
+  JOIN media_file mf ON mf.id = ep.output_media_id
+  WHERE ep.original_media_id = NEW.id AND mf.kind != 'snapshot_base'
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS media_raw_dirty AFTER UPDATE OF raw_mtime ON media_file
+WHEN OLD.raw_mtime IS NOT NULL AND NEW.raw_mtime IS NOT OLD.raw_mtime
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT output_media_id, original_media_id, 'raw', {NOW_SQL}
+  FROM edit_point WHERE original_media_id = NEW.id
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS media_cfg_dirty AFTER UPDATE OF cfg_start, cfg_max_duration ON media_file
+WHEN NEW.cfg_start IS NOT OLD.cfg_start OR NEW.cfg_max_duration IS NOT OLD.cfg_max_duration
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT output_media_id, original_media_id, 'cfg', {NOW_SQL}
+  FROM edit_point WHERE original_media_id = NEW.id OR output_media_id = NEW.id
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS media_output_format_dirty
+AFTER UPDATE OF width, height, frame_rate, codec ON media_file
+WHEN NEW.parent_id IS NOT NULL AND (
+  NEW.width IS NOT OLD.width OR NEW.height IS NOT OLD.height
+  OR NEW.frame_rate IS NOT OLD.frame_rate OR NEW.codec IS NOT OLD.codec
+)
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT output_media_id, original_media_id, 'format', {NOW_SQL}
+  FROM edit_point WHERE output_media_id = NEW.id
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_insert_mtime AFTER INSERT ON marker
+BEGIN
+  UPDATE media_file SET marker_mtime = {NOW_SQL} WHERE id = NEW.media_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_delete_mtime AFTER DELETE ON marker
+BEGIN
+  UPDATE media_file SET marker_mtime = {NOW_SQL} WHERE id = OLD.media_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_update_mtime AFTER UPDATE OF media_id, t, type ON marker
+BEGIN
+  UPDATE media_file SET marker_mtime = {NOW_SQL} WHERE id IN (OLD.media_id, NEW.media_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_insert_dirty AFTER INSERT ON marker
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT ep.output_media_id, ep.original_media_id, 'marker', {NOW_SQL}
+  FROM edit_point ep
+  JOIN media_file mf ON mf.id = ep.output_media_id
+  WHERE ep.original_media_id = NEW.media_id AND mf.kind = 'snapshot_markers'
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_delete_dirty AFTER DELETE ON marker
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT ep.output_media_id, ep.original_media_id, 'marker', {NOW_SQL}
+  FROM edit_point ep
+  JOIN media_file mf ON mf.id = ep.output_media_id
+  WHERE ep.original_media_id = OLD.media_id AND mf.kind = 'snapshot_markers'
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS marker_update_dirty AFTER UPDATE OF media_id, t, type ON marker
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  SELECT ep.output_media_id, ep.original_media_id, 'marker', {NOW_SQL}
+  FROM edit_point ep
+  JOIN media_file mf ON mf.id = ep.output_media_id
+  WHERE ep.original_media_id IN (OLD.media_id, NEW.media_id) AND mf.kind = 'snapshot_markers'
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS edit_point_insert_dirty AFTER INSERT ON edit_point
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  VALUES (NEW.output_media_id, NEW.original_media_id, 'new', {NOW_SQL})
+  {DIRTY_UPSERT};
+END;
+
+CREATE TRIGGER IF NOT EXISTS edit_point_update_dirty
+AFTER UPDATE OF original_media_id, output_media_id, poi_id, camera_id ON edit_point
+BEGIN
+  INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+  VALUES (NEW.output_media_id, NEW.original_media_id, 'edit_point', {NOW_SQL})
+  {DIRTY_UPSERT};
+END;
+"""
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+
+
+def create_schema(conn):
+    conn.executescript(SCHEMA_SQL)
+    for table, column, kind, backfill in ADDED_COLUMNS:
+        if column not in table_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+            conn.execute(backfill.format(now=NOW_SQL))
+    for table, column, expr in GENERATED_COLUMNS:
+        if column not in table_columns(conn, table):
+            conn.execute(
+                f"ALTER TABLE {table} ADD COLUMN {column} REAL GENERATED ALWAYS AS ({expr}) VIRTUAL"
+            )
+    conn.executescript(INDEX_SQL)
+    conn.executescript(TRIGGER_SQL)
+
 
 def main():
     parser = argparse.ArgumentParser(description="Create SQLite schema for toweb.")
@@ -88,7 +368,8 @@ def main():
         os.remove(args.db)
 
     conn = sqlite3.connect(args.db)
-    conn.executescript(SCHEMA_SQL)
+    conn.execute("PRAGMA journal_mode=WAL")
+    create_schema(conn)
     conn.commit()
     conn.close()
 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import sqlite3
+import time
+
+
+def connect(path, timeout=30.0, autocommit=False):
+    # WAL lets the PHP editor and other readers work while a render writes;
+    # synchronous=NORMAL drops the fsync per commit (WAL stays consistent, a
+    # power loss can only lose the last commits). busy_timeout makes writers
+    # wait for the lock instead of failing with "database is locked".
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None if autocommit else "")
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class BatchWriter:
+    # Collects status writes and runs them with executemany in one short
+    # BEGIN IMMEDIATE transaction per flush. Statements run in the order they
+    # were queued; only consecutive rows of the same statement are grouped
+    # into one executemany, so a later write never overtakes an earlier one.
+    # Has the execute/executemany subset of a connection, so helpers can
+    # write to either.
+    def __init__(self, conn, max_rows=1000, max_age=1.0):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.pending = []
+        self.rows = 0
+        self.since = None
+
+    def execute(self, sql, params=()):
+        self.executemany(sql, [params])
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        if self.pending and self.pending[-1][0] == sql:
+            self.pending[-1][1].extend(rows)
+        else:
+            self.pending.append([sql, rows])
+        self.rows += len(rows)
+        if self.since is None:
+            self.since = time.monotonic()
+
+    def due(self):
+        return self.rows >= self.max_rows or (
+            self.since is not None and time.monotonic() - self.since >= self.max_age
+        )
+
+    def maybe_flush(self):
+        if self.due():
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        if self.conn.in_transaction:
+            self.conn.commit()
+        # IMMEDIATE takes the write lock up front, so busy_timeout applies;
+        # a deferred read that later upgrades can fail at once under WAL.
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in self.pending:
+                self.conn.executemany(sql, rows)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        written = self.rows
+        self.pending = []
+        self.rows = 0
+        self.since = None
+        return written
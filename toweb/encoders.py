@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+# name, codec family, ffmpeg encoder, encoder options. {q} is the quality
+# level on the x264 CRF scale (lower = better); {vt} is the same level mapped
+# to the VideoToolbox 1..100 scale (higher = better).
+CANDIDATES = [
+    ("libx264-ultrafast", "h264", "libx264", ["-preset", "ultrafast", "-crf", "{q}"]),
+    ("libx264-superfast", "h264", "libx264", ["-preset", "superfast", "-crf", "{q}"]),
+    ("libx264-veryfast", "h264", "libx264", ["-preset", "veryfast", "-crf", "{q}"]),
+    ("libx264-faster", "h264", "libx264", ["-preset", "faster", "-crf", "{q}"]),
+    ("libx264-medium", "h264", "libx264", ["-preset", "medium", "-crf", "{q}"]),
+    ("h264_nvenc-p1", "h264", "h264_nvenc", ["-preset", "p1", "-rc", "vbr", "-cq", "{q}", "-b:v", "0"]),
+    ("h264_nvenc-p4", "h264", "h264_nvenc", ["-preset", "p4", "-rc", "vbr", "-cq", "{q}", "-b:v", "0"]),
+    ("h264_qsv", "h264", "h264_qsv", ["-preset", "veryfast", "-global_quality", "{q}"]),
+    ("h264_videotoolbox", "h264", "h264_videotoolbox", ["-q:v", "{vt}"]),
+    ("libx265-ultrafast", "hevc", "libx265", ["-preset", "ultrafast", "-crf", "{q}"]),
+    ("libx265-fast", "hevc", "libx265", ["-preset", "fast", "-crf", "{q}"]),
+    ("hevc_nvenc-p4", "hevc", "hevc_nvenc", ["-preset", "p4", "-rc", "vbr", "-cq", "{q}", "-b:v", "0"]),
+    ("hevc_qsv", "hevc", "hevc_qsv", ["-preset", "veryfast", "-global_quality", "{q}"]),
+    ("hevc_videotoolbox", "hevc", "hevc_videotoolbox", ["-q:v", "{vt}"]),
+]
+
+QUALITY_LEVELS = (18, 23, 28)
+
+# Codec values (media_file.codec, poi_crop --venc) that name a family rather
+# than a specific encoder; only these are auto-selected.
+FAMILIES = {"h264": "h264", "avc": "h264", "hevc": "hevc", "h265": "hevc"}
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "toweb", "encoders.json")
+CLIP = {"width": 640, "height": 360, "fps": 25, "seconds": 4}
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return result.stdout.split("\n", 1)[0] or None
+
+
+def available_encoders():
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+    except OSError:
+        return set()
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # " V....D libx264  libx264 H.264 / AVC ..." (flags column, then the name)
+        if len(parts) >= 2 and parts[0].startswith("V") and len(parts[0]) == 6:
+            names.add(parts[1])
+    return names
+
+
+def candidate_args(options, level):
+    return [opt.format(q=level, vt=max(1, min(100, 100 - 2 * level))) for opt in options]
+
+
+def make_reference(path, clip):
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-v",
+        "error",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={clip['width']}x{clip['height']}:rate={clip['fps']}:duration={clip['seconds']}",
+        "-c:v",
+        "ffv1",
+        "-pix_fmt",
+        "yuv420p",
+        path,
+    ]
+    return subprocess.call(cmd, stdout=subprocess.DEVNULL) == 0
+
+
+def measure_ssim(path, ref):
+    cmd = ["ffmpeg", "-hide_banner", "-i", path, "-i", ref, "-lavfi", "[0:v][1:v]ssim", "-f", "null", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    match = re.search(r"All:([0-9.]+)", result.stderr)
+    return float(match.group(1)) if result.returncode == 0 and match else None
+
+
+def calibrate(clip=CLIP, levels=QUALITY_LEVELS, log=print):
+    # One short encode of a synthetic reference per candidate and quality
+    # level: encode speed (fps), size (bits per pixel) and SSIM against the
+    # reference. Candidates missing from this ffmpeg, or failing to open (no
+    # GPU, no driver), are left out.
+    present = available_encoders()
+    frames = clip["fps"] * clip["seconds"]
+    pixels = clip["width"] * clip["height"] * frames
+    results = []
+    with tempfile.TemporaryDirectory(prefix="toweb_enc_") as tmp:
+        ref = os.path.join(tmp, "ref.mkv")
+        if not make_reference(ref, clip):
+            log("Encoder calibration: cannot generate the reference clip (ffmpeg with lavfi needed).")
+            return results
+        out = os.path.join(tmp, "out.mp4")
+        for name, family, encoder, options in CANDIDATES:
+            if encoder not in present:
+                continue
+            for level in levels:
+                args = candidate_args(options, level)
+                cmd = ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-i", ref, "-an", "-c:v", encoder] + args + [out]
+                start = time.monotonic()
+                ok = subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+                seconds = time.monotonic() - start
+                if not ok:
+                    log(f"Encoder calibration: {name} failed, skipped.")
+                    break
+                ssim = measure_ssim(out, ref)
+                if ssim is None:
+                    break
+                results.append(
+                    {
+                        "name": name,
+                        "family": family,
+                        "encoder": encoder,
+                        "args": args,
+                        "level": level,
+                        "fps": round(frames / seconds, 2),
+                        "bpp": round(os.path.getsize(out) * 8 / pixels, 5),
+                        "ssim": round(ssim, 5),
+                    }
+                )
+    return results
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path, data):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def host_results(cache_path=DEFAULT_CACHE, recalibrate=False, log=print):
+    # Calibration results of this host, re-measured when the ffmpeg build or
+    # the calibration clip changes. One cache file can serve many hosts.
+    host = socket.gethostname()
+    version = ffmpeg_version()
+    data = load_cache(cache_path)
+    entry = data.get(host)
+    if not recalibrate and entry and entry.get("ffmpeg") == version and entry.get("clip") == CLIP:
+        return entry["results"]
+    log(f"Calibrating encoders on {host} (one-time, cached in {cache_path})...")
+    results = calibrate(log=log)
+    if not results:
+        # Nothing to remember; the next run tries again.
+        return results
+    data = load_cache(cache_path)
+    data[host] = {"ffmpeg": version, "clip": CLIP, "calibrated_at": iso_now(), "results": results}
+    try:
+        save_cache(cache_path, data)
+    except OSError as exc:
+        log(f"Cannot write encoder cache {cache_path}: {exc}")
+    return results
+
+
+def pick(results, family, min_ssim, max_bpp=None):
+    # Fastest candidate of the family that meets the quality and size target;
+    # ties go to the smaller output.
+    ok = [
+        r
+        for r in results
+        if r["family"] == family and r["ssim"] >= min_ssim and (max_bpp is None or r["bpp"] <= max_bpp)
+    ]
+    if not ok:
+        return None
+    return max(ok, key=lambda r: (r["fps"], -r["bpp"]))
+
+
+def encoder_args(result):
+    return ["-c:v", result["encoder"]] + result["args"]
+
+
+def describe(result):
+    return (
+        f"{result['name']} level {result['level']}: {result['fps']:.1f} fps, "
+        f"{result['bpp']:.4f} bpp, SSIM {result['ssim']:.4f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the local ffmpeg encoders and show the auto pick.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Per-host calibration cache (JSON)")
+    parser.add_argument("--recalibrate", action="store_true", help="Measure again even if cached")
+    parser.add_argument("--min-ssim", type=float, default=0.95)
+    parser.add_argument("--max-bpp", type=float, default=None, help="Size target in bits per pixel")
+    args = parser.parse_args()
+
+    results = host_results(args.cache, args.recalibrate)
+    if not results:
+        print("No usable encoder found.")
+        return 1
+    for result in sorted(results, key=lambda r: (r["family"], -r["fps"])):
+        print(describe(result))
+    for family in sorted(set(FAMILIES.values())):
+        choice = pick(results, family, args.min_ssim, args.max_bpp)
+        print(f"{family}: {describe(choice) if choice else 'no candidate meets the target'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
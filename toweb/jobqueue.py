@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import socket
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import dbaccess
+
+
+CLAIMABLE_SQL = "(state = 'queued' OR (state = 'running' AND lease_until < ?))"
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def connect_queue(path, timeout=30.0):
+    # Autocommit connection: every queue operation opens its own
+    # BEGIN IMMEDIATE transaction so claims are atomic across processes.
+    return dbaccess.connect(path, timeout, autocommit=True)
+
+
+def ensure_queue_schema(conn):
+    try:
+        conn.execute("SELECT 1 FROM render_job LIMIT 1")
+    except sqlite3.OperationalError as exc:
+        raise RuntimeError("Job queue table missing. Run create_db.py first.") from exc
+
+
+def enqueue_jobs(conn, plans, planned_at):
+    # plans: (original_id, output_id, plan_mtime) tuples. Outputs with an active
+    # job are skipped, as are outputs finished by another worker after
+    # planned_at (the caller's plan is already out of date for those).
+    created = iso_now()
+    added = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for original_id, output_id, plan_mtime in plans:
+            cur = conn.execute(
+                """
+                INSERT OR IGNORE INTO render_job
+                  (original_media_id, output_media_id, state, plan_mtime, created_at)
+                SELECT ?, ?, 'queued', ?, ?
+                WHERE NOT EXISTS (
+                  SELECT 1 FROM render_job
+                  WHERE output_media_id = ? AND state = 'done' AND finished_at > ?
+                )
+                """,
+                (original_id, output_id, plan_mtime, created, output_id, planned_at),
+            )
+            added += cur.rowcount
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+
+def claim_jobs(conn, worker, lease, limit=1, max_attempts=3):
+    # Lease up to `limit` claimable jobs of one original. Expired leases that
+    # used up their attempts are failed instead of being handed out again.
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """
+            UPDATE render_job
+            SET state = 'failed', worker = NULL, lease_until = NULL,
+                error = 'lease expired', finished_at = ?
+            WHERE state = 'running' AND lease_until < ? AND attempts >= ?
+            """,
+            (iso_now(), now, max_attempts),
+        )
+        first = conn.execute(
+            f"SELECT original_media_id FROM render_job WHERE {CLAIMABLE_SQL} ORDER BY id LIMIT 1",
+            (now,),
+        ).fetchone()
+        if first is None:
+            conn.execute("COMMIT")
+            return []
+        rows = conn.execute(
+            f"""
+            SELECT * FROM render_job
+            WHERE original_media_id = ? AND {CLAIMABLE_SQL}
+            ORDER BY id
+            LIMIT ?
+            """,
+            (first["original_media_id"], now, limit),
+        ).fetchall()
+        conn.executemany(
+            """
+            UPDATE render_job
+            SET state = 'running', worker = ?, lease_until = ?, heartbeat_at = ?,
+                attempts = attempts + 1, error = NULL
+            WHERE id = ?
+            """,
+            [(worker, now + lease, now, row["id"]) for row in rows],
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def heartbeat(conn, worker, lease):
+    now = time.time()
+    cur = conn.execute(
+        """
+        UPDATE render_job SET lease_until = ?, heartbeat_at = ?
+        WHERE worker = ? AND state = 'running'
+        """,
+        (now + lease, now, worker),
+    )
+    return cur.rowcount
+
+
+def complete_jobs(conn, worker, jobs, ok_ids, max_attempts=3):
+    # Jobs whose lease was lost to another worker are left alone. An original's
+    # conv_mtime is stamped once every job from the same plan is done.
+    finished = iso_now()
+    originals = set()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for job in jobs:
+            if job["output_media_id"] in ok_ids:
+                cur = conn.execute(
+                    """
+                    UPDATE render_job SET state = 'done', lease_until = NULL, finished_at = ?
+                    WHERE id = ? AND worker = ? AND state = 'running'
+                    """,
+                    (finished, job["id"], worker),
+                )
+                if cur.rowcount:
+                    conn.execute(
+                        "UPDATE media_file SET conv_mtime = ? WHERE id = ?",
+                        (job["plan_mtime"], job["output_media_id"]),
+                    )
+                    originals.add((job["original_media_id"], job["plan_mtime"]))
+                continue
+            conn.execute(
+                """
+                UPDATE render_job
+                SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    worker = NULL, lease_until = NULL, error = 'ffmpeg failed',
+                    finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END
+                WHERE id = ? AND worker = ? AND state = 'running'
+                """,
+                (max_attempts, max_attempts, finished, job["id"], worker),
+            )
+        for original_id, plan_mtime in originals:
+            conn.execute(
+                """
+                UPDATE media_file SET conv_mtime = ?
+                WHERE id = ? AND NOT EXISTS (
+                  SELECT 1 FROM render_job
+                  WHERE original_media_id = ? AND plan_mtime = ? AND state != 'done'
+                )
+                """,
+                (plan_mtime, original_id, original_id, plan_mtime),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def release_jobs(conn, worker):
+    # Give leased jobs back to the queue (used on interrupt).
+    return conn.execute(
+        """
+        UPDATE render_job SET state = 'queued', worker = NULL, lease_until = NULL,
+               attempts = MAX(attempts - 1, 0)
+        WHERE worker = ? AND state = 'running'
+        """,
+        (worker,),
+    ).rowcount
+
+
+def queue_counts(conn):
+    rows = conn.execute("SELECT state, COUNT(*) FROM render_job GROUP BY state").fetchall()
+    return {state: count for state, count in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or reset the snapshot render job queue.")
+    parser.add_argument("--db", default="toweb.db")
+    parser.add_argument("--requeue-failed", action="store_true", help="Put failed jobs back into the queue")
+    parser.add_argument("--purge-done", action="store_true", help="Delete finished jobs")
+    args = parser.parse_args()
+
+    conn = connect_queue(args.db)
+    try:
+        ensure_queue_schema(conn)
+    except RuntimeError as exc:
+        print(str(exc))
+        return 1
+
+    if args.requeue_failed:
+        cur = conn.execute(
+            """
+            UPDATE render_job SET state = 'queued', attempts = 0, error = NULL, finished_at = NULL
+            WHERE id IN (
+              SELECT MAX(id) FROM render_job WHERE state = 'failed' GROUP BY output_media_id
+            ) AND NOT EXISTS (
+              SELECT 1 FROM render_job active
+              WHERE active.output_media_id = render_job.output_media_id
+                AND active.state IN ('queued', 'running')
+            )
+            """
+        )
+        print(f"Requeued {cur.rowcount} failed jobs.")
+    if args.purge_done:
+        cur = conn.execute("DELETE FROM render_job WHERE state = 'done'")
+        print(f"Deleted {cur.rowcount} finished jobs.")
+
+    for state, count in sorted(queue_counts(conn).items()):
+        print(f"{state}: {count}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
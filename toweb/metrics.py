@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def progress_cmd(cmd):
+    # Machine-readable progress blocks on stdout instead of the stats line.
+    return cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+
+def parse_speed(value):
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def run_with_progress(cmd, on_progress=None):
+    # Runs ffmpeg with -progress and returns (returncode, last progress block).
+    # stderr is still inherited so errors show up as before.
+    proc = subprocess.Popen(progress_cmd(cmd), stdout=subprocess.PIPE, stderr=sys.stderr, text=True)
+    block = {}
+    last = {}
+    for line in proc.stdout:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value
+        if key == "progress":
+            last = block
+            block = {}
+            if on_progress is not None:
+                on_progress(last)
+    return proc.wait(), last
+
+
+class RunMetrics:
+    # Collects one record per ffmpeg process, appends it to a JSON-lines file
+    # as soon as it is known, and builds the end-of-run summary.
+    def __init__(self, jsonl_path=None, live=False, live_interval=5.0):
+        self.records = []
+        self.started = time.time()
+        self.host = socket.gethostname()
+        self.live = live
+        self.live_interval = live_interval
+        self.lock = threading.Lock()
+        self.jsonl = open(jsonl_path, "a") if jsonl_path else None
+
+    def close(self):
+        if self.jsonl:
+            self.jsonl.close()
+            self.jsonl = None
+
+    def run(self, cmd, in_path, jobs):
+        # Runs without jobs (e.g. proxy builds) are recorded under the last
+        # command argument, the output file.
+        outputs = [job["out_path"] for job in jobs] or cmd[-1:]
+        label = os.path.basename(outputs[0])
+        if len(outputs) > 1:
+            label += f" (+{len(outputs) - 1})"
+        start = time.monotonic()
+        shown = [start]
+
+        def on_progress(block):
+            now = time.monotonic()
+            if self.live and now - shown[0] >= self.live_interval:
+                shown[0] = now
+                print(f"progress: {label} frame={block.get('frame')} fps={block.get('fps')} speed={block.get('speed')}")
+
+        try:
+            returncode, last = run_with_progress(cmd, on_progress)
+        except OSError:
+            self.add(in_path, jobs, outputs, time.monotonic() - start, None, {})
+            raise
+        self.add(in_path, jobs, outputs, time.monotonic() - start, returncode, last)
+        return returncode == 0
+
+    def add(self, in_path, jobs, outputs, wall, returncode, last):
+        frames = parse_number(last.get("frame"), int)
+        out_time_us = parse_number(last.get("out_time_us"), int)
+        out_bytes = 0
+        for path in outputs:
+            try:
+                out_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+        record = {
+            "ts": iso_now(),
+            "host": self.host,
+            "input": in_path,
+            "out_ids": [job["out_id"] for job in jobs],
+            "outputs": outputs,
+            "wall_s": round(wall, 3),
+            "frames": frames,
+            "fps": parse_number(last.get("fps")) or (round(frames / wall, 2) if frames and wall > 0 else None),
+            "speed": parse_speed(last.get("speed")),
+            "out_time_s": round(out_time_us / 1e6, 3) if out_time_us else None,
+            "bytes": out_bytes,
+            "exit_code": returncode,
+            "ok": returncode == 0,
+        }
+        with self.lock:
+            self.records.append(record)
+            if self.jsonl:
+                self.jsonl.write(json.dumps(record) + "\n")
+                self.jsonl.flush()
+
+    def summary(self, slowest=5):
+        records = list(self.records)
+        run_s = time.time() - self.started
+        ok = [r for r in records if r["ok"]]
+        wall = sum(r["wall_s"] for r in records)
+        frames = sum(r["frames"] or 0 for r in records)
+        speeds = [r["speed"] for r in ok if r["speed"]]
+        lines = [
+            f"ffmpeg runs: {len(records)} ({len(records) - len(ok)} failed), "
+            f"outputs: {sum(len(r['out_ids']) for r in ok)}, run time: {run_s:.1f}s",
+            f"encode time: {wall:.1f}s, frames: {frames}, "
+            f"written: {sum(r['bytes'] for r in records) / 1e6:.1f} MB, "
+            f"mean speed: {(sum(speeds) / len(speeds)) if speeds else 0:.2f}x",
+        ]
+        for r in sorted(records, key=lambda r: r["wall_s"], reverse=True)[:slowest]:
+            outputs = ", ".join(os.path.basename(path) for path in r["outputs"])
+            lines.append(f"  slow: {r['wall_s']:.1f}s speed={r['speed']}x {r['input']} -> {outputs}")
+        return "\n".join(lines)
+
+    def write_prom(self, path, prefix="toweb_snapshot"):
+        records = list(self.records)
+        ok = [r for r in records if r["ok"]]
+        # Values describe the last run only; the collector re-reads the file.
+        metrics = [
+            ("jobs", "gauge", "ffmpeg processes of the last run by status", [
+                ('{status="ok"}', len(ok)),
+                ('{status="failed"}', len(records) - len(ok)),
+            ]),
+            ("outputs", "gauge", "Outputs rendered by the last run", [("", sum(len(r["out_ids"]) for r in ok))]),
+            ("encode_seconds", "gauge", "Wall time spent in ffmpeg", [("", sum(r["wall_s"] for r in records))]),
+            ("frames", "gauge", "Frames processed", [("", sum(r["frames"] or 0 for r in records))]),
+            ("bytes_written", "gauge", "Bytes written to outputs", [("", sum(r["bytes"] for r in records))]),
+            ("run_seconds", "gauge", "Duration of the last run", [("", time.time() - self.started)]),
+            ("last_run_timestamp_seconds", "gauge", "End time of the last run", [("", time.time())]),
+        ]
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {round(value, 3)}")
+        # Written atomically so the node_exporter textfile collector never sees
+        # a partial file.
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import random
 import sqlite3
+import time
 from datetime import datetime, timezone, timedelta
 
+import create_db
+
 
 def now_iso(dt=None):
     if dt is None:
@@ -16,6 +20,19 @@ def reset_db(path):
         os.remove(path)
 
 
+def clear_tables(cur):
+    cur.execute("DELETE FROM render_manifest")
+    cur.execute("DELETE FROM dirty_output")
+    cur.execute("DELETE FROM render_job")
+    cur.execute("DELETE FROM edit_point")
+    cur.execute("DELETE FROM poi")
+    cur.execute("DELETE FROM marker")
+    cur.execute("DELETE FROM corrupt_frame")
+    cur.execute("DELETE FROM proxy_file")
+    cur.execute("DELETE FROM media_file")
+    cur.execute("DELETE FROM camera")
+
+
 def seed(path, clear_conv):
     conn = sqlite3.connect(path)
     cur = conn.cursor()
@@ -27,15 +44,19 @@ def seed(path, clear_conv):
 
     if clear_conv:
         cur.execute("UPDATE media_file SET conv_mtime = NULL")
+        cur.execute(
+            """
+            INSERT INTO dirty_output (output_media_id, original_media_id, reason, queued_at)
+            SELECT output_media_id, original_media_id, 'clear_conv', ? FROM edit_point WHERE true
+            ON CONFLICT(output_media_id) DO UPDATE SET seq = seq + 1, reason = excluded.reason
+            """,
+            (now_iso(),),
+        )
         conn.commit()
         conn.close()
         return
 
-    cur.execute("DELETE FROM edit_point")
-    cur.execute("DELETE FROM poi")
-    cur.execute("DELETE FROM marker")
-    cur.execute("DELETE FROM media_file")
-    cur.execute("DELETE FROM camera")
+    clear_tables(cur)
 
     cur.execute(
         """
@@ -131,6 +152,18 @@ def seed(path, clear_conv):
         out_base = cur.lastrowid
         outputs.append((orig_id, out_base, None))
 
+        if orig_id == orig1:
+            # Review windows around the markers instead of a fixed segment.
+            cur.execute(
+                """
+                INSERT INTO media_file
+                  (parent_id, path, kind, width, height, frame_rate, codec, note)
+                VALUES (?, ?, 'snapshot_markers', ?, ?, ?, ?, ?)
+                """,
+                (orig_id, f"out/orig_{label}_markers.mp4", 320, 180, 25.0, "h264", "Marker windows"),
+            )
+            outputs.append((orig_id, cur.lastrowid, None))
+
         for idx in range(1, 3):
             cur.execute(
                 """
@@ -173,6 +206,10 @@ def seed(path, clear_conv):
 
     poi_map = {(orig_id, idx): poi_id for orig_id, idx, poi_id in poi_rows}
 
+    # The POI inserts above bumped poi_mtime through the schema triggers;
+    # restore the test scenario's value.
+    cur.execute("UPDATE media_file SET poi_mtime = ? WHERE id IN (?, ?)", (poi_old, orig1, orig2))
+
     # Markers (review/marker/subtitle/chapter)
     for orig_id in (orig1, orig2):
         cur.execute(
@@ -229,18 +266,184 @@ def seed(path, clear_conv):
     conn.close()
 
 
+# Share of originals per state in --scale mode.
+SCALE_STATES = (("clean", 0.6), ("raw_stale", 0.15), ("poi_stale", 0.15), ("new", 0.1))
+SCALE_FORMATS = ((1920, 1080, 25.0, "h264"), (3840, 2160, 25.0, "prores"), (1920, 1080, 50.0, "h264"))
+MARKER_TYPES = ("review", "marker", "subtitle", "chapter")
+
+
+def scale_original(rng, ids, now, pois, markers, cams):
+    # Rows for one original: (media_file rows, poi rows, edit_point rows, marker rows).
+    rand = rng.random
+    pick = rand()
+    for state, share in SCALE_STATES:
+        pick -= share
+        if pick < 0:
+            break
+    width, height, fps, codec = SCALE_FORMATS[int(rand() * len(SCALE_FORMATS))]
+    duration = 10.0 + rand() * 590.0
+    raw = now - timedelta(days=1.0 + rand() * 89.0)
+    conv = raw + timedelta(hours=1.0 + rand() * 47.0)
+    poi_ts = now_iso(raw + timedelta(minutes=1.0 + rand() * 49.0))
+    if state == "raw_stale":
+        raw = conv + timedelta(hours=1.0 + rand() * 23.0)
+    conv_ts = None if state == "new" else now_iso(conv)
+
+    orig_id = ids["media"]
+    media = [
+        (
+            orig_id, None, f"media/scale/orig_{orig_id:07d}.mov", "original", width, height, fps, codec,
+            duration, 0.0, None, None, now_iso(raw), poi_ts, conv_ts, state,
+        ),
+        (
+            orig_id + 1, orig_id, f"out/scale/{orig_id:07d}_base.mp4", "snapshot_base", 320, 180, 25.0, "h264",
+            3.0, None, None, 3.0, None, None, conv_ts, None,
+        ),
+    ]
+    cam = cams[int(rand() * len(cams))]
+    cam_fields = cam[1:]
+    edit_id = ids["edit"]
+    edit_points = [(edit_id, orig_id, orig_id + 1, None, cam[0], None, None, None, None, None) + cam_fields]
+
+    count = int(rand() * (2 * pois + 1))
+    newer = int(rand() * count) if state == "poi_stale" and count else None
+    poi_id = ids["poi"]
+    out_id = orig_id + 2
+    poi_rows = []
+    for idx in range(count):
+        updated = now_iso(conv + timedelta(hours=1.0 + rand() * 23.0)) if idx == newer else poi_ts
+        poi = (
+            rand() * duration,
+            (0.1 + 0.8 * rand()) * width,
+            (0.1 + 0.8 * rand()) * height,
+            1.0 + 1.5 * rand(),
+            1.0 + 19.0 * rand(),
+        )
+        poi_rows.append((poi_id + idx, orig_id) + poi + (cam[0], updated))
+        media.append(
+            (
+                out_id + idx, orig_id, f"out/scale/{orig_id:07d}_poi_{idx + 1}.mp4", "snapshot_poi", 320, 180,
+                25.0, "h264", 3.0, None, None, 3.0, None, None, conv_ts, None,
+            )
+        )
+        edit_points.append((edit_id + 1 + idx, orig_id, out_id + idx, poi_id + idx, cam[0]) + poi + cam_fields)
+    ids["media"] = out_id + count
+    ids["poi"] = poi_id + count
+    ids["edit"] = edit_id + 1 + count
+
+    marker_rows = [
+        (orig_id, rand() * duration, MARKER_TYPES[int(rand() * len(MARKER_TYPES))], f"Marker {idx + 1}")
+        for idx in range(int(rand() * (2 * markers + 1)))
+    ]
+    return media, poi_rows, edit_points, marker_rows
+
+
+def seed_scale(path, originals, pois, markers, seed_value, batch=10000):
+    # Deterministic bulk data for load tests. Triggers and indexes are dropped
+    # during the load (the rows carry their own timestamps) and recreated
+    # afterwards by create_db, which is much faster than per-row maintenance.
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM media_file LIMIT 1")
+    except sqlite3.OperationalError as exc:
+        conn.close()
+        raise RuntimeError("Database schema missing. Run create_db.py first.") from exc
+
+    started = time.monotonic()
+    conn.execute("PRAGMA synchronous=OFF")
+    for kind, name in cur.execute(
+        "SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'index') AND sql IS NOT NULL"
+    ).fetchall():
+        cur.execute(f"DROP {kind.upper()} {name}")
+    clear_tables(cur)
+
+    rng = random.Random(seed_value)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    cams = []
+    for idx in range(1, 6):
+        cam = (idx, f"Cam-{idx}", f"Scale camera {idx}", 24.0, 70.0, 1.4, 2.8, "T")
+        cur.execute(
+            """
+            INSERT INTO camera
+              (id, name, note, lens_focal_min, lens_focal_max, lens_stop_min, lens_stop_max, stop_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            cam,
+        )
+        cams.append(cam)
+
+    ids = {"media": 1, "poi": 1, "edit": 1}
+    totals = {"media_file": 0, "poi": 0, "edit_point": 0, "marker": 0}
+    for first in range(0, originals, batch):
+        media, poi_rows, edit_points, marker_rows = [], [], [], []
+        for _ in range(first, min(originals, first + batch)):
+            rows = scale_original(rng, ids, now, pois, markers, cams)
+            media += rows[0]
+            poi_rows += rows[1]
+            edit_points += rows[2]
+            marker_rows += rows[3]
+        cur.executemany(
+            """
+            INSERT INTO media_file
+              (id, parent_id, path, kind, width, height, frame_rate, codec, duration, start_time,
+               cfg_start, cfg_max_duration, raw_mtime, poi_mtime, conv_mtime, note)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            media,
+        )
+        cur.executemany(
+            """
+            INSERT INTO poi (id, media_id, t, x, y, z, distance, default_camera_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            poi_rows,
+        )
+        cur.executemany(
+            """
+            INSERT INTO edit_point
+              (id, original_media_id, output_media_id, poi_id, camera_id,
+               poi_t, poi_x, poi_y, poi_z, poi_distance,
+               camera_name, camera_note, lens_focal_min, lens_focal_max,
+               lens_stop_min, lens_stop_max, stop_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            edit_points,
+        )
+        cur.executemany("INSERT INTO marker (media_id, t, type, text) VALUES (?, ?, ?, ?)", marker_rows)
+        conn.commit()
+        totals["media_file"] += len(media)
+        totals["poi"] += len(poi_rows)
+        totals["edit_point"] += len(edit_points)
+        totals["marker"] += len(marker_rows)
+
+    create_db.create_schema(conn)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    summary = ", ".join(f"{count} {table}" for table, count in totals.items())
+    print(f"Seeded {originals} originals ({summary}) in {time.monotonic() - started:.1f}s.")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Seed a test SQLite DB for snapshot tasks.")
     parser.add_argument("--db", default="toweb.db")
     parser.add_argument("--reset-db", action="store_true", help="Delete and recreate the DB")
     parser.add_argument("--clear-conv", action="store_true", help="Clear conv_mtime to force re-run")
+    parser.add_argument("--scale", type=int, default=None, metavar="N", help="Generate N originals of bulk test data")
+    parser.add_argument("--pois", type=int, default=10, help="Average POIs per original (--scale)")
+    parser.add_argument("--markers", type=int, default=4, help="Average markers per original (--scale)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (--scale)")
     args = parser.parse_args()
 
     if args.reset_db:
         reset_db(args.db)
 
     try:
-        seed(args.db, args.clear_conv)
+        if args.scale is not None:
+            seed_scale(args.db, args.scale, args.pois, args.markers, args.seed)
+        else:
+            seed(args.db, args.clear_conv)
     except RuntimeError as exc:
         print(str(exc))
         return 1
@@ -1,21 +1,30 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import hashlib
 import os
 import sqlite3
 import subprocess
 import sys
 import json
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 
+import dbaccess
+import encoders
+import jobqueue
+import metrics as run_metrics
 
-def parse_ts(val):
-    if not val:
-        return None
-    return datetime.fromisoformat(val.replace("Z", "+00:00"))
+
+def iso_ts(dt):
+    return dt.isoformat(timespec="seconds").replace("+00:00", "Z")
 
 
 def iso_now():
-    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+    return iso_ts(datetime.now(timezone.utc))
 
 
 def file_mtime(path):
@@ -26,46 +35,135 @@ def file_mtime(path):
     return datetime.fromtimestamp(ts, tz=timezone.utc)
 
 
+def julian_day(dt):
+    return dt.timestamp() / 86400.0 + 2440587.5
+
+
 def ensure_schema(conn):
     try:
         conn.execute("SELECT 1 FROM media_file LIMIT 1")
     except sqlite3.OperationalError as exc:
         raise RuntimeError("Database schema missing. Run create_db.py first.") from exc
+    try:
+        conn.execute("SELECT raw_mtime_jd FROM media_file LIMIT 1")
+        conn.execute("SELECT 1 FROM dirty_output LIMIT 1")
+        conn.execute("SELECT 1 FROM probe_cache LIMIT 1")
+        conn.execute("SELECT 1 FROM render_manifest LIMIT 1")
+        conn.execute("SELECT 1 FROM keyframe_index LIMIT 1")
+        conn.execute("SELECT 1 FROM proxy_file LIMIT 1")
+    except sqlite3.OperationalError as exc:
+        raise RuntimeError("Database schema outdated. Run create_db.py first.") from exc
 
 
-def load_poi_max_ts(conn, media_id):
-    rows = conn.execute(
-        "SELECT updated_at FROM poi WHERE media_id = ? AND updated_at IS NOT NULL",
-        (media_id,),
-    ).fetchall()
-    max_ts = None
-    for (val,) in rows:
-        ts = parse_ts(val)
-        if ts and (max_ts is None or ts > max_ts):
-            max_ts = ts
-    return max_ts
+EDIT_POINT_COLUMNS = """
+       ep.*,
+       mf.id AS out_id,
+       mf.path AS out_path,
+       mf.kind AS out_kind,
+       mf.width AS out_width,
+       mf.height AS out_height,
+       mf.frame_rate AS out_frame_rate,
+       mf.codec AS out_codec,
+       mf.duration AS out_duration,
+       mf.cfg_start AS out_cfg_start,
+       mf.cfg_max_duration AS out_cfg_max_duration,
+       mf.conv_mtime AS out_conv_mtime,
+       p.t AS poi_t,
+       p.x AS poi_x,
+       p.y AS poi_y,
+       p.z AS poi_z,
+       p.distance AS poi_distance,
+       p.updated_at AS poi_updated_at
+"""
+
+# Every output of every original with its staleness inputs, filtered down to
+# candidates in SQL. The effective conversion time of an output is the newer
+# of the original's and the output's own conv_mtime. Originals without
+# raw_mtime stay candidates; their file mtime is checked in Python.
+STALE_OUTPUTS_SQL = f"""
+WITH poi_max AS (
+  SELECT media_id, MAX(updated_jd) AS poi_max_jd
+  FROM poi
+  GROUP BY media_id
+),
+candidate AS (
+  SELECT {EDIT_POINT_COLUMNS},
+         o.path AS media_path,
+         o.cfg_start AS media_cfg_start,
+         o.cfg_max_duration AS media_cfg_max_duration,
+         o.raw_mtime_jd AS raw_jd,
+         CASE
+           WHEN o.conv_mtime_jd IS NULL OR mf.conv_mtime_jd > o.conv_mtime_jd THEN mf.conv_mtime_jd
+           ELSE o.conv_mtime_jd
+         END AS conv_jd,
+         o.poi_mtime_jd AS poi_jd,
+         o.marker_mtime_jd AS marker_jd,
+         p.updated_jd AS poi_updated_jd,
+         pm.poi_max_jd AS poi_max_jd
+  FROM media_file o
+  JOIN edit_point ep ON ep.original_media_id = o.id
+  JOIN media_file mf ON mf.id = ep.output_media_id
+  LEFT JOIN poi p ON p.id = ep.poi_id
+  LEFT JOIN poi_max pm ON pm.media_id = o.id
+  WHERE o.parent_id IS NULL AND o.kind = 'original'
+)
+SELECT *,
+       out_kind NOT IN ('snapshot_base', 'snapshot_markers') AND (
+         poi_jd > conv_jd
+         OR poi_updated_jd > conv_jd
+         OR (poi_updated_jd IS NULL AND poi_max_jd > conv_jd)
+       ) AS poi_stale,
+       out_kind = 'snapshot_markers' AND marker_jd > conv_jd AS markers_stale
+FROM candidate
+WHERE conv_jd IS NULL
+   OR raw_jd IS NULL
+   OR raw_jd > conv_jd
+   OR (out_kind NOT IN ('snapshot_base', 'snapshot_markers') AND (
+         poi_jd > conv_jd
+         OR poi_updated_jd > conv_jd
+         OR (poi_updated_jd IS NULL AND poi_max_jd > conv_jd)
+       ))
+   OR (out_kind = 'snapshot_markers' AND marker_jd > conv_jd)
+ORDER BY original_media_id, out_kind, out_id
+"""
+
+# Outputs pushed into dirty_output by the schema triggers. They are rendered
+# without any timestamp checks.
+DIRTY_OUTPUTS_SQL = f"""
+SELECT {EDIT_POINT_COLUMNS},
+       o.path AS media_path,
+       o.cfg_start AS media_cfg_start,
+       o.cfg_max_duration AS media_cfg_max_duration,
+       d.seq AS dirty_seq
+FROM dirty_output d
+JOIN edit_point ep ON ep.output_media_id = d.output_media_id
+JOIN media_file o ON o.id = ep.original_media_id
+JOIN media_file mf ON mf.id = ep.output_media_id
+LEFT JOIN poi p ON p.id = ep.poi_id
+ORDER BY ep.original_media_id, mf.kind, mf.id
+"""
+
+PROBE_KEYS = ("width", "height", "frame_rate", "codec", "duration", "start_time")
+
+ORIGINALS_SQL = "SELECT * FROM media_file WHERE parent_id IS NULL AND kind = 'original'"
+
+# Originals that still need ffprobe metadata or a raw_mtime from the file.
+MAINTENANCE_SQL = """
+SELECT * FROM media_file
+WHERE parent_id IS NULL AND kind = 'original'
+  AND (width IS NULL OR height IS NULL OR frame_rate IS NULL OR codec IS NULL
+       OR duration IS NULL OR start_time IS NULL OR raw_mtime IS NULL)
+"""
+
+DIRTY_MAINTENANCE_SQL = MAINTENANCE_SQL + """
+  AND id IN (SELECT original_media_id FROM dirty_output)
+"""
 
 
 def load_edit_points(conn, media_id):
     return conn.execute(
-        """
-        SELECT ep.*,
-               mf.id AS out_id,
-               mf.path AS out_path,
-               mf.kind AS out_kind,
-               mf.width AS out_width,
-               mf.height AS out_height,
-               mf.frame_rate AS out_frame_rate,
-               mf.codec AS out_codec,
-               mf.duration AS out_duration,
-               mf.cfg_start AS out_cfg_start,
-               mf.cfg_max_duration AS out_cfg_max_duration,
-               p.t AS poi_t,
-               p.x AS poi_x,
-               p.y AS poi_y,
-               p.z AS poi_z,
-               p.distance AS poi_distance,
-               p.updated_at AS poi_updated_at
+        f"""
+        SELECT {EDIT_POINT_COLUMNS}
         FROM edit_point ep
         JOIN media_file mf ON mf.id = ep.output_media_id
         LEFT JOIN poi p ON p.id = ep.poi_id
@@ -82,10 +180,12 @@ def resolve_path(base_dir, path_value):
     return os.path.join(base_dir, path_value)
 
 
-def run_ffmpeg(cmd, dry_run):
+def run_ffmpeg(cmd, dry_run, metrics=None, in_path=None, jobs=()):
     if dry_run:
         print("DRY RUN:", " ".join(cmd))
         return True
+    if metrics is not None:
+        return metrics.run(cmd, in_path, jobs)
     result = subprocess.run(cmd, stdout=sys.stdout, stderr=sys.stderr)
     return result.returncode == 0
 
@@ -144,6 +244,41 @@ def probe_media(path):
     }
 
 
+def probe_keyframes(path):
+    # Packet scan of the first video stream (demux only, no decode). Times are
+    # made relative to the first packet, like the -ss values they are compared to.
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+    times = []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        try:
+            t = float(pts)
+        except ValueError:
+            continue
+        times.append(t)
+        if "K" in flags:
+            keyframes.append(t)
+    if not keyframes:
+        return None
+    first = min(times)
+    return {"keyframes": sorted(round(t - first, 6) for t in keyframes), "packets": len(times)}
+
+
 def choose_codec(value):
     if not value:
         return "libx264"
@@ -152,42 +287,18 @@ def choose_codec(value):
     return value
 
 
-def render_base(inp, outp, out_w, out_h, start, duration, codec, frame_rate, dry_run):
-    vf = (
+def base_filter(out_w, out_h):
+    return (
         f"scale={out_w}:{out_h}:force_original_aspect_ratio=decrease,"
         f"pad={out_w}:{out_h}:(ow-iw)/2:(oh-ih)/2"
     )
-    cmd = ["ffmpeg", "-hide_banner", "-y"]
-    if start is not None:
-        cmd += ["-ss", str(start)]
-    cmd += ["-i", inp]
-    if duration is not None:
-        cmd += ["-t", str(duration)]
-    cmd += [
-        "-vf",
-        vf,
-        "-an",
-        "-c:v",
-        choose_codec(codec),
-        "-crf",
-        "28",
-        "-preset",
-        "veryfast",
-        outp,
-    ]
-    if frame_rate:
-        vf_index = cmd.index("-vf")
-        cmd[vf_index:vf_index] = ["-r", str(frame_rate)]
-    return run_ffmpeg(cmd, dry_run)
 
 
-def render_poi(inp, outp, out_w, out_h, start, duration, codec, frame_rate, poi, dry_run):
+def poi_filter(out_w, out_h, poi):
     x = poi["poi_x"]
     y = poi["poi_y"]
     z = poi["poi_z"] or 1.0
-    t = poi["poi_t"] or 0
-
-    vf = (
+    return (
         f"crop="
         f"w='{out_w}/({z})':"
         f"h='{out_h}/({z})':"
@@ -195,33 +306,1165 @@ def render_poi(inp, outp, out_w, out_h, start, duration, codec, frame_rate, poi,
         f"y='max(0, min(ih-oh, ({y})-oh/2))',"
         f"scale={out_w}:{out_h}"
     )
+
+
+def poi_seek(start, poi):
+    seek = poi["poi_t"] or 0
+    if start is not None:
+        seek = start + seek
+    return seek
+
+
+def ffmpeg_head(threads=None):
     cmd = ["ffmpeg", "-hide_banner", "-y"]
-    seek = t
+    if threads:
+        cmd += ["-filter_threads", str(threads), "-filter_complex_threads", str(threads)]
+    return cmd
+
+
+def input_args(inp, threads=None):
+    if threads:
+        return ["-threads", str(threads), "-i", inp]
+    return ["-i", inp]
+
+
+def encode_args(codec, frame_rate, threads=None, encoder=None):
+    # `encoder` is the auto-selected encoder (full -c:v arguments), if any.
+    args = []
+    if frame_rate:
+        args += ["-r", str(frame_rate)]
+    if encoder:
+        args += ["-an"] + encoder
+    else:
+        args += ["-an", "-c:v", choose_codec(codec), "-crf", "28", "-preset", "veryfast"]
+    if threads:
+        args += ["-threads", str(threads)]
+    return args
+
+
+def build_base_cmd(inp, outp, out_w, out_h, start, duration, codec, frame_rate, threads=None, encoder=None):
+    cmd = ffmpeg_head(threads)
     if start is not None:
-        seek = start + t
+        cmd += ["-ss", str(start)]
+    cmd += input_args(inp, threads)
+    if duration is not None:
+        cmd += ["-t", str(duration)]
+    cmd += ["-vf", base_filter(out_w, out_h)]
+    return cmd + encode_args(codec, frame_rate, threads, encoder) + [outp]
+
+
+def build_poi_cmd(inp, outp, out_w, out_h, start, duration, codec, frame_rate, poi, threads=None, encoder=None):
+    cmd = ffmpeg_head(threads)
+    seek = poi_seek(start, poi)
     if seek:
         cmd += ["-ss", str(seek)]
-    cmd += ["-i", inp]
+    cmd += input_args(inp, threads)
     if duration is not None:
         cmd += ["-t", str(duration)]
-    cmd += [
-        "-vf",
-        vf,
-        "-an",
-        "-c:v",
-        choose_codec(codec),
-        "-crf",
-        "28",
-        "-preset",
-        "veryfast",
-        outp,
-    ]
-    if frame_rate:
-        vf_index = cmd.index("-vf")
-        cmd[vf_index:vf_index] = ["-r", str(frame_rate)]
+    cmd += ["-vf", poi_filter(out_w, out_h, poi)]
+    return cmd + encode_args(codec, frame_rate, threads, encoder) + [outp]
+
+
+def render_base(inp, outp, out_w, out_h, start, duration, codec, frame_rate, dry_run):
+    cmd = build_base_cmd(inp, outp, out_w, out_h, start, duration, codec, frame_rate)
+    return run_ffmpeg(cmd, dry_run)
+
+
+def render_poi(inp, outp, out_w, out_h, start, duration, codec, frame_rate, poi, dry_run):
+    cmd = build_poi_cmd(inp, outp, out_w, out_h, start, duration, codec, frame_rate, poi)
     return run_ffmpeg(cmd, dry_run)
 
 
+# Intra-only codecs for the proxy cache, keyed by --proxy-codec.
+PROXY_CODECS = {
+    "prores": ["-c:v", "prores_ks", "-profile:v", "0", "-pix_fmt", "yuv422p10le"],
+    "mjpeg": ["-c:v", "mjpeg", "-q:v", "2", "-pix_fmt", "yuvj422p"],
+    "h264-intra": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "14", "-g", "1", "-pix_fmt", "yuv420p"],
+}
+
+
+def proxy_size(src_w, src_h, height):
+    # None when the proxy would not be smaller than the original: decoding a
+    # full-size copy saves nothing.
+    height -= height % 2
+    if height >= src_h:
+        return None
+    return int(round(src_w * height / src_h / 2.0)) * 2, height
+
+
+def build_proxy_cmd(inp, outp, width, height, codec, threads=None):
+    # Whole original, video only, on the same timeline, so POI seeks are unchanged.
+    cmd = ffmpeg_head(threads) + input_args(inp, threads)
+    cmd += ["-map", "0:v:0", "-vf", f"scale={width}:{height}", "-an"] + PROXY_CODECS[codec]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    return cmd + [outp]
+
+
+# Typical originals and zooms for --check-proxy.
+PROXY_CHECK_SOURCES = (("1080p", 1920, 1080), ("4K", 3840, 2160), ("6K", 6144, 3456))
+PROXY_CHECK_ZOOMS = (1.0, 1.5, 2.0, 3.0)
+
+
+def check_proxy(args):
+    # Routes a centred POI of each typical original and zoom through
+    # proxy_size/proxy_job, as a render does, and prints where it is cut from.
+    # Fails if a zoomed (z = 1.5) 4K POI stays on the original, or if a
+    # proxied crop does not cover the same source area.
+    ok = True
+    for name, src_w, src_h in PROXY_CHECK_SOURCES:
+        size = proxy_size(src_w, src_h, args.proxy_height)
+        proxy = None
+        if size is not None:
+            proxy = {"src_w": src_w, "src_h": src_h, "width": size[0], "height": size[1], "min_ratio": args.proxy_min_ratio}
+        cells = []
+        for z in PROXY_CHECK_ZOOMS:
+            job = {"kind": "snapshot_poi", "poi": {"poi_x": src_w / 2, "poi_y": src_h / 2, "poi_z": z}}
+            scaled = proxy_job(job, proxy)
+            if scaled is None:
+                cells.append(f"z={z:g} original")
+                ok = ok and not (name == "4K" and z == 1.5)
+                continue
+            # A crop of 180 / z source rows is 180 / z' proxy rows: the same area.
+            sy = proxy["height"] / src_h
+            if abs(180 / z * sy - 180 / scaled["poi"]["poi_z"]) > 1e-2:
+                print(f"{name} z={z:g}: proxy crop does not match the source crop")
+                ok = False
+            cells.append(f"z={z:g} proxy {proxy['width']}x{proxy['height']}")
+        print(f"{name:6s} " + ", ".join(cells))
+    if not ok:
+        print(f"--proxy-height {args.proxy_height} --proxy-min-ratio {args.proxy_min_ratio} leaves zoomed 4K POIs on the original")
+        return 1
+    return 0
+
+
+def is_poi_job(job):
+    return job["kind"] != "snapshot_base" and job["poi"]["poi_x"] is not None and job["poi"]["poi_y"] is not None
+
+
+def proxy_job(job, proxy):
+    # A POI crop is out_w / z source pixels wide. On a proxy scaled by s it is
+    # out_w * s / z proxy pixels wide, so it gives s / z proxy pixels per output
+    # pixel; the proxy is used while that is at least proxy["min_ratio"].
+    # Returns a copy of the job with the POI moved to proxy coordinates, or None.
+    if proxy is None or not is_poi_job(job):
+        return None
+    poi = job["poi"]
+    sx = proxy["width"] / proxy["src_w"]
+    sy = proxy["height"] / proxy["src_h"]
+    z = poi["poi_z"] or 1.0
+    if min(sx, sy) / z < proxy["min_ratio"] - 1e-6:
+        return None
+    scaled = dict(poi)
+    scaled.update(poi_x=round(poi["poi_x"] * sx, 3), poi_y=round(poi["poi_y"] * sy, 3), poi_z=round(z / sy, 6))
+    return dict(job, poi=scaled)
+
+
+THUMB_KINDS = ("snapshot_poster", "snapshot_sprite", "snapshot_vtt")
+
+
+def thumb_branches(job, src, tag):
+    # Poster and sprite sheet branches fed from `src`, the base window with
+    # timestamps starting at 0. Frames are picked by index after an fps filter,
+    # so the sheets line up exactly with the WebVTT cues.
+    thumbs = job["thumbs"]
+    rate = thumbs["rate"]
+    select = "+".join(f"eq(n,{n})" for n in thumbs["frames"])
+    graph = [
+        f"{src}split=2[tp{tag}][ts{tag}]",
+        f"[tp{tag}]fps={rate},select='eq(n,{thumbs['poster_n']})',{base_filter(job['out_w'], job['out_h'])}[poster{tag}]",
+        f"[ts{tag}]fps={rate},select='{select}',{base_filter(thumbs['tw'], thumbs['th'])},"
+        f"tile={thumbs['cols']}x{thumbs['rows']}[sprite{tag}]",
+    ]
+    outputs = ["-map", f"[poster{tag}]", "-frames:v", "1", "-update", "1", "-q:v", "3", thumbs["poster"]]
+    outputs += ["-map", f"[sprite{tag}]", "-q:v", "4", thumbs["sprite"]]
+    return graph, outputs
+
+
+def build_base_thumbs_cmd(inp, job, threads=None):
+    # Base snapshot, poster and sprite sheets from one decode.
+    cmd = ffmpeg_head(threads)
+    if job["start"] is not None:
+        cmd += ["-ss", str(job["start"])]
+    if job["duration"] is not None:
+        cmd += ["-t", str(job["duration"])]
+    cmd += input_args(inp, threads)
+    graph, outputs = thumb_branches(job, "[t0]", 0)
+    graph = ["[0:v]split=2[b0][t0]", f"[b0]{base_filter(job['out_w'], job['out_h'])}[v0]"] + graph
+    cmd += ["-filter_complex", ";".join(graph), "-map", "[v0]"]
+    return cmd + encode_args(job["codec"], job["frame_rate"], threads, job.get("encoder")) + [job["out_path"]] + outputs
+
+
+def attach_thumbs(conn, media_id, jobs, args):
+    # Plans the poster, sprite sheets and WebVTT index of each base job:
+    # thumbnails every --sprite-interval seconds plus one at every marker.
+    if not getattr(args, "thumbs", False):
+        return
+    base = [job for job in jobs if job["kind"] == "snapshot_base"]
+    if not base:
+        return
+    media = conn.execute("SELECT duration, frame_rate FROM media_file WHERE id = ?", (media_id,)).fetchone()
+    markers = [row[0] for row in conn.execute("SELECT t FROM marker WHERE media_id = ? ORDER BY t", (media_id,))]
+    for job in base:
+        start = job["start"] or 0.0
+        length = job["duration"]
+        if media is not None and media["duration"] is not None:
+            rest = media["duration"] - start
+            length = rest if length is None else min(length, rest)
+        if not length or length <= 0:
+            print(f"Unknown duration, no thumbnails for: {job['out_path']}")
+            continue
+        rate = job["frame_rate"] or (media["frame_rate"] if media is not None else None) or 25.0
+        last = max(int(length * rate) - 1, 0)
+        times = [k * args.sprite_interval for k in range(int(math.ceil(length / args.sprite_interval)))]
+        times += [t - start for t in markers if start <= t < start + length]
+        frames = sorted({min(int(round(t * rate)), last) for t in times})
+
+        tw = args.thumb_width - args.thumb_width % 2
+        th = max(2, int(round(tw * job["out_h"] / job["out_w"] / 2.0)) * 2)
+        per_sheet = args.sprite_cols * args.sprite_rows
+        stem = os.path.splitext(job["out_path"])[0]
+        stem_rel = os.path.splitext(job["out_rel"])[0]
+        job["thumbs"] = {
+            "rate": rate,
+            "length": length,
+            "frames": frames,
+            "poster_n": min(int(length * args.poster_at * rate), last),
+            "tw": tw,
+            "th": th,
+            "cols": args.sprite_cols,
+            "rows": args.sprite_rows,
+            "sheets": int(math.ceil(len(frames) / per_sheet)),
+            "stem": stem,
+            "stem_rel": stem_rel,
+            "poster": f"{stem}_poster.jpg",
+            "sprite": f"{stem}_sprite_%03d.jpg",
+            "vtt": f"{stem}_thumbs.vtt",
+        }
+
+
+MARKERS_KIND = "snapshot_markers"
+
+
+def merge_windows(times, pre, post, lo=0.0, hi=None):
+    # [t - pre, t + post] around each marker, clipped to [lo, hi]; overlapping
+    # or touching windows are merged.
+    windows = []
+    for t in sorted(times):
+        start = max(lo, t - pre)
+        end = t + post if hi is None else min(hi, t + post)
+        if end <= start:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    return [(round(start, 6), round(end, 6)) for start, end in windows]
+
+
+def group_segments(windows, gap):
+    # Windows less than `gap` seconds apart share one input: decoding through
+    # a short gap is cheaper than seeking to the next keyframe again.
+    segments = []
+    for window in windows:
+        if segments and window[0] - segments[-1][-1][1] < gap:
+            segments[-1].append(window)
+        else:
+            segments.append([window])
+    return segments
+
+
+def attach_marker_windows(conn, media_id, jobs, args):
+    # Plans the windows of each marker output from the markers of the selected
+    # types over the whole original. Only the output's own cfg_start and
+    # cfg_max_duration narrow the range; the ones inherited from the original
+    # (and --duration) describe the fixed segment of the other outputs.
+    # Markers left outside are reported. Outputs without matching markers are
+    # dropped from this run.
+    marker_jobs = [job for job in jobs if job["kind"] == MARKERS_KIND]
+    if not marker_jobs:
+        return
+    media = conn.execute("SELECT duration FROM media_file WHERE id = ?", (media_id,)).fetchone()
+    times = [
+        row[0]
+        for row in conn.execute(
+            f"SELECT t FROM marker WHERE media_id = ? AND type IN ({', '.join('?' * len(args.marker_types))})",
+            (media_id,) + tuple(args.marker_types),
+        )
+    ]
+    for job in marker_jobs:
+        lo = job["poi"]["out_cfg_start"] or 0.0
+        hi = media["duration"] if media is not None else None
+        limit = job["poi"]["out_cfg_max_duration"]
+        if limit is not None:
+            hi = lo + limit if hi is None else min(hi, lo + limit)
+        inside = [t for t in times if t >= lo and (hi is None or t <= hi)]
+        if len(inside) < len(times):
+            print(
+                f"{len(times) - len(inside)} of {len(times)} markers outside cfg_start/cfg_max_duration "
+                f"of {job['out_path']}, not rendered"
+            )
+        windows = merge_windows(inside, args.marker_pre, args.marker_post, lo, hi)
+        if not windows:
+            print(f"No {'/'.join(args.marker_types)} markers, skipped: {job['out_path']}")
+            jobs.remove(job)
+            continue
+        job["windows"] = windows
+        job["segments"] = group_segments(windows, args.marker_gap)
+
+
+def build_markers_cmd(inp, job, threads=None):
+    # One seeked input per segment; the windows of a segment are cut from its
+    # single decode with trim and all of them are joined with concat.
+    cmd = ffmpeg_head(threads)
+    graph = []
+    parts = []
+    for idx, segment in enumerate(job["segments"]):
+        seek = segment[0][0]
+        cmd += ["-ss", str(seek), "-t", str(round(segment[-1][1] - seek, 6))] + input_args(inp, threads)
+        labels = [f"[w{len(parts) + k}]" for k in range(len(segment))]
+        sources = [f"[{idx}:v]"]
+        if len(segment) > 1:
+            sources = [f"[i{len(parts) + k}]" for k in range(len(segment))]
+            graph.append(f"[{idx}:v]split={len(segment)}" + "".join(sources))
+        for source, label, (start, end) in zip(sources, labels, segment):
+            graph.append(
+                f"{source}trim=start={round(start - seek, 6)}:end={round(end - seek, 6)},setpts=PTS-STARTPTS{label}"
+            )
+        parts += labels
+    graph.append("".join(parts) + f"concat=n={len(parts)}:v=1:a=0,{base_filter(job['out_w'], job['out_h'])}[v]")
+    cmd += ["-filter_complex", ";".join(graph), "-map", "[v]"]
+    return cmd + encode_args(job["codec"], job["frame_rate"], threads, job.get("encoder")) + [job["out_path"]]
+
+
+def vtt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def write_thumbs_vtt(job):
+    # One cue per thumbnail, lasting until the next one; image references are
+    # relative to the .vtt file.
+    thumbs = job["thumbs"]
+    per_sheet = thumbs["cols"] * thumbs["rows"]
+    starts = [n / thumbs["rate"] for n in thumbs["frames"]]
+    lines = ["WEBVTT", ""]
+    for idx, start in enumerate(starts):
+        end = starts[idx + 1] if idx + 1 < len(starts) else thumbs["length"]
+        sheet = os.path.basename(thumbs["sprite"] % (idx // per_sheet + 1))
+        cell = idx % per_sheet
+        x = cell % thumbs["cols"] * thumbs["tw"]
+        y = cell // thumbs["cols"] * thumbs["th"]
+        lines += [f"{vtt_time(start)} --> {vtt_time(end)}", f"{sheet}#xywh={x},{y},{thumbs['tw']},{thumbs['th']}", ""]
+    with open(thumbs["vtt"], "w") as f:
+        f.write("\n".join(lines))
+    # Sheets left over from a longer previous render.
+    extra = thumbs["sheets"] + 1
+    while os.path.exists(thumbs["sprite"] % extra):
+        os.remove(thumbs["sprite"] % extra)
+        extra += 1
+
+
+def register_thumbs(conn, media_id, jobs):
+    # The artifacts are media_file outputs of the original, replaced on every
+    # render of their base snapshot.
+    now = iso_now()
+    for job in jobs:
+        thumbs = job.get("thumbs")
+        if not thumbs:
+            continue
+        prefix = thumbs["stem_rel"] + "_"
+        conn.execute(
+            f"""
+            DELETE FROM media_file
+            WHERE parent_id = ? AND kind IN ({', '.join('?' * len(THUMB_KINDS))}) AND substr(path, 1, ?) = ?
+            """,
+            (media_id,) + THUMB_KINDS + (len(prefix), prefix),
+        )
+        sheet_w = thumbs["cols"] * thumbs["tw"]
+        sheet_h = thumbs["rows"] * thumbs["th"]
+        rows = [(f"{prefix}poster.jpg", "snapshot_poster", job["out_w"], job["out_h"], "mjpeg", None)]
+        rows += [
+            (f"{prefix}sprite_{idx:03d}.jpg", "snapshot_sprite", sheet_w, sheet_h, "mjpeg", None)
+            for idx in range(1, thumbs["sheets"] + 1)
+        ]
+        rows.append((f"{prefix}thumbs.vtt", "snapshot_vtt", None, None, "webvtt", thumbs["length"]))
+        conn.executemany(
+            """
+            INSERT INTO media_file (parent_id, path, kind, width, height, codec, duration, conv_mtime)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(media_id,) + row + (now,) for row in rows],
+        )
+
+
+def build_job_cmd(inp, job, threads=None):
+    if job.get("windows"):
+        return build_markers_cmd(inp, job, threads)
+    if job.get("thumbs"):
+        return build_base_thumbs_cmd(inp, job, threads)
+    if job["kind"] == "snapshot_base":
+        return build_base_cmd(
+            inp,
+            job["out_path"],
+            job["out_w"],
+            job["out_h"],
+            job["start"],
+            job["duration"],
+            job["codec"],
+            job["frame_rate"],
+            threads,
+            job.get("encoder"),
+        )
+    return build_poi_cmd(
+        inp,
+        job["out_path"],
+        job["out_w"],
+        job["out_h"],
+        job["start"],
+        job["duration"],
+        job["codec"],
+        job["frame_rate"],
+        job["poi"],
+        threads,
+        job.get("encoder"),
+    )
+
+
+def job_window(job):
+    start = job["start"] or 0.0
+    if job["kind"] != "snapshot_base":
+        start = poi_seek(job["start"], job["poi"]) or 0.0
+    return start, job["duration"]
+
+
+def job_filter(job):
+    if job["kind"] == "snapshot_base":
+        return base_filter(job["out_w"], job["out_h"])
+    return poi_filter(job["out_w"], job["out_h"], job["poi"])
+
+
+def build_multi_cmd(inp, jobs, threads=None):
+    # One decode of the input, split into a trimmed branch per output.
+    windows = [job_window(job) for job in jobs]
+    seek = min(start for start, _ in windows)
+    cmd = ffmpeg_head(threads)
+    if seek:
+        cmd += ["-ss", str(seek)]
+    if all(duration is not None for _, duration in windows):
+        cmd += ["-t", str(max(start + duration for start, duration in windows) - seek)]
+    cmd += input_args(inp, threads)
+
+    graph = [f"[0:v]split={len(jobs)}" + "".join(f"[s{idx}]" for idx in range(len(jobs)))]
+    extra = []
+    for idx, (job, (start, duration)) in enumerate(zip(jobs, windows)):
+        trim = f"trim=start={start - seek}"
+        if duration is not None:
+            trim += f":duration={duration}"
+        if job.get("thumbs"):
+            graph.append(f"[s{idx}]{trim},setpts=PTS-STARTPTS,split=2[b{idx}][t{idx}]")
+            graph.append(f"[b{idx}]{job_filter(job)}[v{idx}]")
+            thumb_graph, thumb_outputs = thumb_branches(job, f"[t{idx}]", idx)
+            graph += thumb_graph
+            extra += thumb_outputs
+        else:
+            graph.append(f"[s{idx}]{trim},setpts=PTS-STARTPTS,{job_filter(job)}[v{idx}]")
+    cmd += ["-filter_complex", ";".join(graph)]
+
+    for idx, job in enumerate(jobs):
+        encode = encode_args(job["codec"], job["frame_rate"], threads, job.get("encoder"))
+        cmd += ["-map", f"[v{idx}]"] + encode + [job["out_path"]]
+    return cmd + extra
+
+
+def job_encoder(codec, args):
+    # Only a generic family (NULL, 'h264', 'hevc') is auto-selected; a codec
+    # naming a specific encoder (libx264, h264_nvenc, ...) is used as is.
+    picks = getattr(args, "encoder_picks", None)
+    if not picks:
+        return None
+    return picks.get(encoders.FAMILIES.get((codec or "h264").lower()))
+
+
+def pick_encoders(args):
+    # Fastest calibrated encoder per codec family that meets --min-ssim and
+    # --max-bpp; families without a match keep the libx264 default.
+    results = encoders.host_results(args.encoder_cache, args.recalibrate)
+    picks = {}
+    for family in sorted(set(encoders.FAMILIES.values())):
+        choice = encoders.pick(results, family, args.min_ssim, args.max_bpp)
+        if choice is None:
+            print(f"Auto encoder: no {family} encoder meets the target, using the default.")
+            continue
+        print(f"Auto encoder ({family}): {encoders.describe(choice)}")
+        picks[family] = encoders.encoder_args(choice)
+    return picks
+
+
+def make_job(media, ep, out_base, args):
+    out_w = ep["out_width"] or args.out_w
+    out_h = ep["out_height"] or args.out_h
+    if not out_w or not out_h:
+        print(f"Missing output size for out_id={ep['out_id']}")
+        return None
+
+    cfg_start = ep["out_cfg_start"]
+    if cfg_start is None:
+        cfg_start = media["cfg_start"]
+    max_duration = ep["out_cfg_max_duration"]
+    if max_duration is None:
+        max_duration = media["cfg_max_duration"]
+    if max_duration is None and args.duration is not None:
+        max_duration = args.duration
+
+    return {
+        "out_id": ep["out_id"],
+        "out_path": resolve_path(out_base, ep["out_path"]),
+        "out_rel": ep["out_path"],
+        "kind": ep["out_kind"],
+        "out_w": out_w,
+        "out_h": out_h,
+        "start": cfg_start,
+        "duration": max_duration,
+        "codec": ep["out_codec"],
+        "encoder": job_encoder(ep["out_codec"], args),
+        "frame_rate": ep["out_frame_rate"],
+        "poi": ep,
+        "dirty_seq": ep["dirty_seq"] if "dirty_seq" in ep.keys() else None,
+    }
+
+
+def sample_hash(path, samples=16, block=65536):
+    # Size plus evenly spaced blocks: cheap on multi-GB originals, and immune
+    # to touch/re-copy because mtime is not part of it.
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        if size <= samples * block:
+            digest.update(f.read())
+        else:
+            step = (size - block) // (samples - 1)
+            for idx in range(samples):
+                f.seek(idx * step)
+                digest.update(f.read(block))
+    return digest.hexdigest()
+
+
+def fingerprint_jobs(in_path, jobs):
+    # The fingerprint covers the source content and the exact ffmpeg arguments
+    # (minus the input path and thread settings, which do not change the result).
+    source_hash = sample_hash(in_path)
+    for job in jobs:
+        cmd = build_job_cmd("<source>", job)
+        job["source_hash"] = source_hash
+        job["manifest_args"] = json.dumps(cmd)
+        job["fingerprint"] = hashlib.sha256(f"{source_hash}\n{job['manifest_args']}".encode()).hexdigest()
+
+
+def split_unchanged(conn, in_path, jobs, force):
+    try:
+        fingerprint_jobs(in_path, jobs)
+    except OSError as exc:
+        print(f"Cannot hash input {in_path}: {exc}")
+        return jobs, []
+    if force:
+        return jobs, []
+    rows = conn.execute(
+        f"SELECT output_media_id, fingerprint FROM render_manifest WHERE output_media_id IN ({', '.join('?' * len(jobs))})",
+        [job["out_id"] for job in jobs],
+    ).fetchall()
+    known = {row[0]: row[1] for row in rows}
+    todo = []
+    unchanged = []
+    for job in jobs:
+        if known.get(job["out_id"]) == job["fingerprint"] and os.path.exists(job["out_path"]):
+            print(f"Unchanged, skipped: {job['out_path']}")
+            unchanged.append(job)
+        else:
+            todo.append(job)
+    return todo, unchanged
+
+
+def record_manifest(conn, jobs):
+    now = iso_now()
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO render_manifest (output_media_id, fingerprint, source_hash, args, rendered_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            (job["out_id"], job["fingerprint"], job["source_hash"], job["manifest_args"], now)
+            for job in jobs
+            if job.get("fingerprint")
+        ],
+    )
+
+
+def prev_keyframe(keyframes, t):
+    idx = bisect.bisect_right(keyframes, t + 1e-6) - 1
+    return keyframes[idx] if idx >= 0 else 0.0
+
+
+def group_windows(jobs, keyframes):
+    # An input seek decodes from the keyframe before the window start. If that
+    # keyframe lies inside the span an earlier group already decodes, the job
+    # joins that group: decoding on is cheaper than decoding the same GOP
+    # prefix again in another process. Intra-only sources never group.
+    groups = []
+    end = None
+    for job in sorted(jobs, key=lambda job: job_window(job)[0]):
+        start, duration = job_window(job)
+        stop = start + duration if duration is not None else float("inf")
+        if groups and prev_keyframe(keyframes, start) < end:
+            groups[-1].append(job)
+            end = max(end, stop)
+        else:
+            groups.append([job])
+            end = stop
+    return groups
+
+
+def split_tasks(in_path, jobs, single_decode, keyframes=None):
+    # Marker outputs already share decodes between their windows; they always
+    # run as their own task.
+    own = [(in_path, [job]) for job in jobs if job.get("windows")]
+    jobs = [job for job in jobs if not job.get("windows")]
+    if single_decode and len(jobs) > 1:
+        return [(in_path, jobs)] + own
+    if keyframes:
+        return [(in_path, group) for group in group_windows(jobs, keyframes)] + own
+    return [(in_path, [job]) for job in jobs] + own
+
+
+def run_task(task, threads, dry_run, metrics=None):
+    in_path, jobs = task
+    for job in jobs:
+        os.makedirs(os.path.dirname(job["out_path"]), exist_ok=True)
+
+    if len(jobs) > 1:
+        ok = run_ffmpeg(build_multi_cmd(in_path, jobs, threads), dry_run, metrics, in_path, jobs)
+    else:
+        ok = run_ffmpeg(build_job_cmd(in_path, jobs[0], threads), dry_run, metrics, in_path, jobs)
+    if not ok:
+        print(f"ffmpeg failed for output{'s' if len(jobs) > 1 else ''}: {', '.join(job['out_path'] for job in jobs)}")
+        return []
+    for job in jobs:
+        if job.get("thumbs") and not dry_run:
+            write_thumbs_vtt(job)
+    return [job["out_id"] for job in jobs]
+
+
+def run_task_timed(task, threads, dry_run, metrics=None):
+    start = time.monotonic()
+    ok_ids = run_task(task, threads, dry_run, metrics)
+    return ok_ids, time.monotonic() - start
+
+
+def clear_dirty(conn, jobs):
+    # Entries re-dirtied after planning have a newer seq and are kept.
+    conn.executemany(
+        "DELETE FROM dirty_output WHERE output_media_id = ? AND seq = ?",
+        [(job["out_id"], job["dirty_seq"]) for job in jobs if job["dirty_seq"] is not None],
+    )
+
+
+def record_results(writer, media_id, stamp, updated_outputs, complete, jobs=(), dry_run=False):
+    # The stamp is taken when the original is planned, so edits made while its
+    # outputs render stay newer than conv_mtime and are picked up next run.
+    # Writes are queued on a dbaccess.BatchWriter and committed in batches.
+    ids = list(updated_outputs)
+    if ids and complete:
+        ids.append(media_id)
+    writer.executemany("UPDATE media_file SET conv_mtime = ? WHERE id = ?", [(stamp, out_id) for out_id in ids])
+    done = [job for job in jobs if job["out_id"] in updated_outputs]
+    clear_dirty(writer, done)
+    if not dry_run:
+        record_manifest(writer, done)
+        register_thumbs(writer, media_id, done)
+
+
+def threads_per_job(args):
+    if args.threads_per_job:
+        return args.threads_per_job
+    if args.jobs > 1:
+        return max(1, (os.cpu_count() or 1) // args.jobs)
+    return None
+
+
+def connect_db(path):
+    return dbaccess.connect(path)
+
+
+def file_identity(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def load_probe_cache(conn, identities):
+    wanted = set(identities)
+    paths = sorted({ident[0] for ident in wanted})
+    found = {}
+    for idx in range(0, len(paths), 500):
+        chunk = paths[idx:idx + 500]
+        rows = conn.execute(
+            f"SELECT * FROM probe_cache WHERE path IN ({', '.join('?' * len(chunk))})",
+            chunk,
+        )
+        for row in rows:
+            ident = (row["path"], row["size"], row["mtime_ns"], row["inode"])
+            if ident in wanted:
+                found[ident] = {key: row[key] for key in PROBE_KEYS}
+    return found
+
+
+def probe_files(paths_by_ident, probe_jobs):
+    probed = {}
+    if not paths_by_ident:
+        return probed
+    with ThreadPoolExecutor(max_workers=max(1, probe_jobs)) as pool:
+        results = pool.map(probe_media, paths_by_ident.values())
+        for ident, meta in zip(paths_by_ident, results):
+            if meta:
+                probed[ident] = meta
+    return probed
+
+
+def refresh_originals(conn, base_dir, query=MAINTENANCE_SQL, probe_jobs=4, force_probe=False):
+    # Fill missing format fields and raw_mtime. ffprobe results are cached per
+    # file identity; misses are probed in parallel and everything is written
+    # back in one transaction.
+    originals = []
+    for media in conn.execute(query).fetchall():
+        in_path = resolve_path(base_dir, media["path"])
+        try:
+            originals.append((media, in_path, file_identity(in_path)))
+        except OSError:
+            continue
+
+    need = [
+        (media, ident)
+        for media, _, ident in originals
+        if force_probe or any(media[key] is None for key in PROBE_KEYS)
+    ]
+    cached = load_probe_cache(conn, [ident for _, ident in need])
+    misses = {ident: ident[0] for _, ident in need if ident not in cached}
+    probed = probe_files(misses, probe_jobs)
+    now = iso_now()
+
+    conn.executemany(
+        f"""
+        INSERT OR REPLACE INTO probe_cache
+          (path, size, mtime_ns, inode, {', '.join(PROBE_KEYS)}, probed_at)
+        VALUES (?, ?, ?, ?, {', '.join('?' * len(PROBE_KEYS))}, ?)
+        """,
+        [ident + tuple(meta.get(key) for key in PROBE_KEYS) + (now,) for ident, meta in probed.items()],
+    )
+    metas = dict(cached)
+    metas.update(probed)
+    conn.executemany(
+        f"""
+        UPDATE media_file
+        SET {', '.join(f'{key} = COALESCE({key}, ?)' for key in PROBE_KEYS)}
+        WHERE id = ?
+        """,
+        [
+            tuple(metas[ident].get(key) for key in PROBE_KEYS) + (media["id"],)
+            for media, ident in need
+            if ident in metas
+        ],
+    )
+    conn.executemany(
+        "UPDATE media_file SET raw_mtime = ? WHERE id = ? AND raw_mtime IS NULL",
+        [
+            (iso_ts(datetime.fromtimestamp(ident[2] / 1e9, tz=timezone.utc)), media["id"])
+            for media, _, ident in originals
+            if media["raw_mtime"] is None
+        ],
+    )
+    conn.commit()
+    return len(need), len(cached), len(probed)
+
+
+def load_keyframe_index(conn, paths, probe_jobs=4):
+    # Keyframe times per input path, cached in keyframe_index per file identity
+    # (a replaced file gets a new index, its old rows are dropped).
+    idents = {}
+    for path in paths:
+        try:
+            idents[file_identity(path)] = path
+        except OSError:
+            continue
+    found = {}
+    for ident in idents:
+        row = conn.execute(
+            "SELECT keyframes FROM keyframe_index WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            ident,
+        ).fetchone()
+        if row is not None:
+            found[idents[ident]] = json.loads(row[0])
+    misses = [ident for ident in idents if idents[ident] not in found]
+    if misses:
+        with ThreadPoolExecutor(max_workers=max(1, probe_jobs)) as pool:
+            results = list(pool.map(probe_keyframes, [ident[0] for ident in misses]))
+        now = iso_now()
+        for ident, index in zip(misses, results):
+            if index is None:
+                print(f"Keyframe index failed: {ident[0]}")
+                continue
+            conn.execute("DELETE FROM keyframe_index WHERE path = ?", (ident[0],))
+            conn.execute(
+                """
+                INSERT INTO keyframe_index (path, size, mtime_ns, inode, keyframes, packets, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                ident + (json.dumps(index["keyframes"]), index["packets"], now),
+            )
+            found[idents[ident]] = index["keyframes"]
+        conn.commit()
+    return found, len(idents) - len(misses)
+
+
+def plan_originals(conn, base_dir, out_base, args):
+    refresh_originals(conn, base_dir, MAINTENANCE_SQL, args.probe_jobs)
+
+    planned = []
+    current = None
+    for row in conn.execute(STALE_OUTPUTS_SQL):
+        media_id = row["original_media_id"]
+        if current is None or current[0] != media_id:
+            in_path = resolve_path(base_dir, row["media_path"])
+            if not os.path.exists(in_path):
+                print(f"Missing input: {in_path} (media_id={media_id})")
+                in_path = None
+            media = {"cfg_start": row["media_cfg_start"], "cfg_max_duration": row["media_cfg_max_duration"]}
+            current = (media_id, in_path, [], iso_now())
+            planned.append(current)
+        in_path = current[1]
+        if in_path is None:
+            continue
+
+        raw_jd = row["raw_jd"]
+        if raw_jd is None:
+            raw_ts = file_mtime(in_path)
+            raw_jd = julian_day(raw_ts) if raw_ts else None
+        conv_jd = row["conv_jd"]
+        stale = conv_jd is None or (raw_jd is not None and raw_jd > conv_jd) or row["poi_stale"]
+        stale = stale or row["markers_stale"]
+        if not stale:
+            continue
+
+        job = make_job(media, row, out_base, args)
+        if job:
+            current[2].append(job)
+    return [plan for plan in planned if plan[1] and plan[2]]
+
+
+def plan_dirty(conn, base_dir, out_base, args):
+    refresh_originals(conn, base_dir, DIRTY_MAINTENANCE_SQL, args.probe_jobs)
+    conn.execute(
+        "DELETE FROM dirty_output WHERE output_media_id NOT IN (SELECT output_media_id FROM edit_point)"
+    )
+    conn.commit()
+
+    planned = []
+    for row in conn.execute(DIRTY_OUTPUTS_SQL):
+        media_id = row["original_media_id"]
+        if not planned or planned[-1][0] != media_id:
+            in_path = resolve_path(base_dir, row["media_path"])
+            if not os.path.exists(in_path):
+                print(f"Missing input: {in_path} (media_id={media_id})")
+                in_path = None
+            planned.append((media_id, in_path, [], iso_now()))
+        if planned[-1][1] is None:
+            continue
+        media = {"cfg_start": row["media_cfg_start"], "cfg_max_duration": row["media_cfg_max_duration"]}
+        job = make_job(media, row, out_base, args)
+        if job:
+            planned[-1][2].append(job)
+    return [plan for plan in planned if plan[1] and plan[2]]
+
+
+def prepare_proxies(conn, planned, args, threads, metrics=None):
+    # planned: (media_id, in_path, jobs) with the jobs still to render. A proxy
+    # is reused while the original's raw_mtime (and the proxy settings) match;
+    # otherwise it is rebuilt, but only for originals with a POI job it can serve.
+    ready = {}
+    build = []
+    for media_id, in_path, jobs in planned:
+        media = conn.execute("SELECT width, height, raw_mtime FROM media_file WHERE id = ?", (media_id,)).fetchone()
+        if media is None or not media["width"] or not media["height"]:
+            continue
+        size = proxy_size(media["width"], media["height"], args.proxy_height)
+        if size is None:
+            continue
+        width, height = size
+        proxy = {
+            "src_w": media["width"],
+            "src_h": media["height"],
+            "width": width,
+            "height": height,
+            "min_ratio": args.proxy_min_ratio,
+        }
+        if not any(proxy_job(job, proxy) for job in jobs):
+            continue
+        row = conn.execute("SELECT * FROM proxy_file WHERE media_id = ?", (media_id,)).fetchone()
+        if (
+            row is not None
+            and row["raw_mtime"] == media["raw_mtime"]
+            and (row["width"], row["height"], row["codec"]) == (width, height, args.proxy_codec)
+            and os.path.exists(row["path"])
+        ):
+            ready[media_id] = dict(proxy, path=row["path"])
+            continue
+        proxy["path"] = os.path.join(args.proxy_dir, f"{media_id}.mov")
+        build.append((media_id, in_path, proxy, media["raw_mtime"]))
+    if not build:
+        return ready
+
+    def run(item):
+        _, in_path, proxy, _ = item
+        tmp = f"{os.path.splitext(proxy['path'])[0]}.tmp.mov"
+        cmd = build_proxy_cmd(in_path, tmp, proxy["width"], proxy["height"], args.proxy_codec, threads)
+        try:
+            if not run_ffmpeg(cmd, args.dry_run, metrics, in_path):
+                return False
+        except OSError as exc:
+            print(f"ffmpeg could not be started for proxy {proxy['path']}: {exc}")
+            return False
+        if not args.dry_run:
+            try:
+                os.replace(tmp, proxy["path"])
+            except OSError as exc:
+                print(f"Cannot store proxy {proxy['path']}: {exc}")
+                return False
+        return True
+
+    os.makedirs(args.proxy_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(run, build))
+    now = iso_now()
+    for (media_id, _, proxy, raw_mtime), ok in zip(build, results):
+        if not ok:
+            print(f"Proxy failed, rendering from the original: media_id={media_id}")
+            continue
+        ready[media_id] = proxy
+        if not args.dry_run:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO proxy_file (media_id, path, width, height, codec, raw_mtime, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (media_id, proxy["path"], proxy["width"], proxy["height"], args.proxy_codec, raw_mtime, now),
+            )
+    conn.commit()
+    return ready
+
+
+def render_plan(conn, planned, args, threads, timings=None, metrics=None):
+    # timings (optional list) receives one entry per ffmpeg task: the media id,
+    # its jobs, the output ids that succeeded and the wall time in seconds.
+    todos = []
+    for media_id, in_path, jobs, stamp in planned:
+        attach_thumbs(conn, media_id, jobs, args)
+        attach_marker_windows(conn, media_id, jobs, args)
+        todo, unchanged = split_unchanged(conn, in_path, jobs, args.force)
+        todos.append((media_id, in_path, jobs, stamp, todo, [job["out_id"] for job in unchanged]))
+    proxies = {}
+    if getattr(args, "proxy_dir", None):
+        proxies = prepare_proxies(conn, [(media_id, in_path, todo) for media_id, in_path, _, _, todo, _ in todos],
+                                  args, threads, metrics)
+    # Only originals that still decode for some output are indexed: not those
+    # whose outputs are all unchanged or all cut from a proxy.
+    keyframes = {}
+    if getattr(args, "keyframe_index", False) and not args.single_decode:
+        paths = [
+            in_path
+            for media_id, in_path, _, _, todo, _ in todos
+            if any(proxy_job(job, proxies.get(media_id)) is None for job in todo)
+        ]
+        if paths:
+            keyframes, _ = load_keyframe_index(conn, paths, args.probe_jobs)
+
+    writer = dbaccess.BatchWriter(conn)
+    try:
+        render_tasks(todos, proxies, keyframes, writer, args, threads, timings, metrics)
+    finally:
+        writer.flush()
+
+
+def render_tasks(todos, proxies, keyframes, writer, args, threads, timings=None, metrics=None):
+    pending = {}
+    tasks = []
+    poi_jobs = 0
+    proxy_jobs = 0
+    for media_id, in_path, jobs, stamp, todo, updated in todos:
+        # POI jobs the proxy can serve are cut from it; the fingerprint still
+        # describes the original, so switching proxies on or off re-renders nothing.
+        direct = []
+        from_proxy = []
+        for job in todo:
+            scaled = proxy_job(job, proxies.get(media_id))
+            if scaled:
+                from_proxy.append(scaled)
+            else:
+                direct.append(job)
+        poi_jobs += sum(1 for job in todo if is_poi_job(job))
+        proxy_jobs += len(from_proxy)
+        media_tasks = split_tasks(in_path, direct, args.single_decode, keyframes.get(in_path))
+        if from_proxy:
+            media_tasks += split_tasks(proxies[media_id]["path"], from_proxy, args.single_decode)
+        if not media_tasks:
+            record_results(writer, media_id, stamp, updated, True, jobs, args.dry_run)
+            continue
+        pending[media_id] = {"stamp": stamp, "left": len(media_tasks), "jobs": jobs, "updated": updated}
+        tasks += [(media_id, task) for task in media_tasks]
+    if getattr(args, "proxy_dir", None) and poi_jobs:
+        print(f"Proxy: {proxy_jobs} of {poi_jobs} POI outputs cut from proxies (--proxy-min-ratio {args.proxy_min_ratio})")
+
+    # Tasks may finish in any order; an original is only marked converted once
+    # all of its outputs have been rendered successfully. Results are flushed
+    # at least every writer.max_age seconds, even while long renders run.
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(run_task_timed, task, threads, args.dry_run, metrics): (media_id, task)
+            for media_id, task in tasks
+        }
+        running = set(futures)
+        while running:
+            finished, running = wait(running, timeout=writer.max_age, return_when=FIRST_COMPLETED)
+            for future in finished:
+                media_id, task = futures[future]
+                state = pending[media_id]
+                try:
+                    ok_ids, seconds = future.result()
+                    state["updated"] += ok_ids
+                    if timings is not None:
+                        timings.append({"media_id": media_id, "jobs": task[1], "ok_ids": ok_ids, "seconds": seconds})
+                except OSError as exc:
+                    print(f"ffmpeg could not be started for media_id={media_id}: {exc}")
+                state["left"] -= 1
+                if state["left"] == 0:
+                    complete = len(state["updated"]) == len(state["jobs"])
+                    record_results(
+                        writer, media_id, state["stamp"], state["updated"], complete, state["jobs"], args.dry_run
+                    )
+            writer.maybe_flush()
+
+
+def enqueue_plan(db_path, planned, planned_at):
+    conn = jobqueue.connect_queue(db_path)
+    try:
+        plans = [(media_id, job["out_id"], stamp) for media_id, _, jobs, stamp in planned for job in jobs]
+        added = jobqueue.enqueue_jobs(conn, plans, planned_at)
+        # Queued outputs are tracked by render_job from here on.
+        clear_dirty(conn, [job for _, _, jobs, _ in planned for job in jobs])
+    finally:
+        conn.close()
+    print(f"Queued {added} of {len(plans)} stale outputs.")
+
+
+def load_claimed_jobs(conn, claimed, base_dir, out_base, args):
+    original_id = claimed[0]["original_media_id"]
+    media = conn.execute("SELECT * FROM media_file WHERE id = ?", (original_id,)).fetchone()
+    if media is None:
+        return None, []
+    in_path = resolve_path(base_dir, media["path"])
+    if not os.path.exists(in_path):
+        print(f"Missing input: {in_path} (media_id={original_id})")
+        return in_path, []
+    wanted = {row["output_media_id"] for row in claimed}
+    jobs = []
+    for ep in load_edit_points(conn, original_id):
+        if ep["out_id"] in wanted:
+            job = make_job(media, ep, out_base, args)
+            if job:
+                jobs.append(job)
+    attach_thumbs(conn, original_id, jobs, args)
+    attach_marker_windows(conn, original_id, jobs, args)
+    return in_path, jobs
+
+
+def queue_worker(worker, base_dir, out_base, args, threads, stop, metrics=None):
+    conn = jobqueue.connect_queue(args.db)
+    limit = args.claim_batch if args.single_decode or args.keyframe_index else 1
+    try:
+        while not stop.is_set():
+            claimed = jobqueue.claim_jobs(conn, worker, args.lease, limit, args.max_attempts)
+            if not claimed:
+                counts = jobqueue.queue_counts(conn)
+                if not counts.get("queued") and not counts.get("running"):
+                    return
+                # Jobs leased by other workers may still expire and come back.
+                stop.wait(args.poll)
+                continue
+
+            in_path, jobs = load_claimed_jobs(conn, claimed, base_dir, out_base, args)
+            ok_ids = []
+            keyframes = {}
+            if jobs:
+                jobs, unchanged = split_unchanged(conn, in_path, jobs, args.force)
+                ok_ids += [job["out_id"] for job in unchanged]
+                if args.keyframe_index and not args.single_decode and len(jobs) > 1:
+                    keyframes, _ = load_keyframe_index(conn, [in_path], 1)
+            for task in split_tasks(in_path, jobs, args.single_decode, keyframes.get(in_path)):
+                try:
+                    ok_ids += run_task(task, threads, args.dry_run, metrics)
+                except OSError as exc:
+                    print(f"ffmpeg could not be started: {exc}")
+            jobqueue.complete_jobs(conn, worker, claimed, set(ok_ids), args.max_attempts)
+            if not args.dry_run:
+                done = [job for job in jobs if job["out_id"] in ok_ids]
+                writer = dbaccess.BatchWriter(conn)
+                record_manifest(writer, done)
+                register_thumbs(writer, claimed[0]["original_media_id"], done)
+                writer.flush()
+    finally:
+        conn.close()
+
+
+def heartbeat_loop(db_path, worker, lease, stop):
+    conn = jobqueue.connect_queue(db_path)
+    try:
+        while not stop.wait(max(1.0, lease / 3.0)):
+            jobqueue.heartbeat(conn, worker, lease)
+    finally:
+        conn.close()
+
+
+def work_queue(base_dir, out_base, args, threads, metrics=None):
+    worker = jobqueue.worker_name()
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat_loop, args=(args.db, worker, args.lease, stop), daemon=True)
+    beat.start()
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [
+                pool.submit(queue_worker, worker, base_dir, out_base, args, threads, stop, metrics)
+                for _ in range(args.jobs)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                stop.set()
+    finally:
+        stop.set()
+        beat.join()
+        conn = jobqueue.connect_queue(args.db)
+        released = jobqueue.release_jobs(conn, worker)
+        conn.close()
+        if released:
+            print(f"Released {released} unfinished jobs back to the queue.")
+
+
+def finish_metrics(metrics, args):
+    metrics.close()
+    if metrics.records:
+        print(metrics.summary())
+    if args.prom and not args.dry_run:
+        metrics.write_prom(args.prom)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate small snapshot videos from a SQLite task DB.")
     parser.add_argument("--db", default="toweb.db")
@@ -229,143 +1472,198 @@ def main():
     parser.add_argument("--out-w", default=None, type=int)
     parser.add_argument("--out-h", default=None, type=int)
     parser.add_argument("--duration", default=None, type=float, help="Override max duration (seconds)")
+    parser.add_argument(
+        "--single-decode",
+        action="store_true",
+        help="Render all outputs of an original from one decode (one ffmpeg per original)",
+    )
+    parser.add_argument("--jobs", default=1, type=int, help="Number of ffmpeg processes run concurrently")
+    parser.add_argument(
+        "--threads-per-job",
+        default=None,
+        type=int,
+        help="ffmpeg threads per process (default: CPU count / --jobs when --jobs > 1)",
+    )
+    parser.add_argument(
+        "--dirty",
+        action="store_true",
+        help="Only render outputs queued in dirty_output by the DB triggers",
+    )
+    parser.add_argument("--probe-jobs", default=4, type=int, help="Concurrent ffprobe processes")
+    parser.add_argument(
+        "--keyframe-index",
+        action="store_true",
+        help="Index keyframes of the originals and render nearby POIs from shared decodes",
+    )
+    parser.add_argument(
+        "--probe-only",
+        action="store_true",
+        help="Probe all originals into the probe cache and fill missing fields, then exit",
+    )
+    parser.add_argument(
+        "--thumbs",
+        action="store_true",
+        help="Also write a poster, sprite sheets and a WebVTT thumbnail index with each base snapshot",
+    )
+    parser.add_argument("--sprite-interval", default=2.0, type=float, help="Seconds between sprite thumbnails")
+    parser.add_argument("--sprite-cols", default=10, type=int)
+    parser.add_argument("--sprite-rows", default=10, type=int)
+    parser.add_argument("--thumb-width", default=160, type=int, help="Sprite thumbnail width in pixels")
+    parser.add_argument(
+        "--poster-at",
+        default=0.5,
+        type=float,
+        help="Poster frame position as a fraction of the base window (0 = first frame)",
+    )
+    parser.add_argument(
+        "--marker-types",
+        default="review",
+        help="Comma-separated marker types rendered by snapshot_markers outputs",
+    )
+    parser.add_argument("--marker-pre", default=2.0, type=float, help="Seconds kept before each marker")
+    parser.add_argument("--marker-post", default=3.0, type=float, help="Seconds kept after each marker")
+    parser.add_argument(
+        "--marker-gap",
+        default=10.0,
+        type=float,
+        help="Marker windows closer than this many seconds are cut from one decode",
+    )
+    parser.add_argument(
+        "--proxy-dir",
+        default=None,
+        help="Cut POI snapshots from low-res intra proxies kept in this folder (relative to the DB); "
+        "a crop with zoom z uses the proxy while proxy_height / src_height / z >= --proxy-min-ratio",
+    )
+    parser.add_argument(
+        "--proxy-height",
+        default=1440,
+        type=int,
+        help="Proxy height in pixels; originals not taller than this get no proxy",
+    )
+    parser.add_argument(
+        "--proxy-min-ratio",
+        default=0.25,
+        type=float,
+        help="Proxy pixels per output pixel a POI crop needs to be cut from the proxy (1 = no detail loss); "
+        "the defaults serve 4K POIs up to z = 2.6 and 6K (3456 rows) up to z = 1.6",
+    )
+    parser.add_argument(
+        "--check-proxy",
+        action="store_true",
+        help="Print which typical POI crops --proxy-height/--proxy-min-ratio cut from a proxy, then exit",
+    )
+    parser.add_argument("--proxy-codec", choices=sorted(PROXY_CODECS), default="prores")
+    parser.add_argument(
+        "--auto-encoder",
+        action="store_true",
+        help="Encode h264/hevc outputs with the fastest calibrated encoder meeting --min-ssim/--max-bpp",
+    )
+    parser.add_argument("--min-ssim", default=0.95, type=float, help="Quality target of --auto-encoder")
+    parser.add_argument("--max-bpp", default=None, type=float, help="Size target of --auto-encoder (bits per pixel)")
+    parser.add_argument("--encoder-cache", default=encoders.DEFAULT_CACHE, help="Per-host encoder calibration cache")
+    parser.add_argument("--recalibrate", action="store_true", help="Re-run the encoder calibration")
+    parser.add_argument("--enqueue", action="store_true", help="Plan stale outputs into the render_job queue")
+    parser.add_argument("--worker", action="store_true", help="Render jobs claimed from the render_job queue")
+    parser.add_argument("--lease", default=300.0, type=float, help="Job lease length in seconds (queue mode)")
+    parser.add_argument("--max-attempts", default=3, type=int, help="Attempts before a job is marked failed")
+    parser.add_argument("--poll", default=5.0, type=float, help="Seconds between claims when the queue is busy")
+    parser.add_argument(
+        "--claim-batch",
+        default=64,
+        type=int,
+        help="Max jobs of one original claimed at once with --single-decode",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-render even when the render manifest fingerprint matches",
+    )
+    parser.add_argument("--metrics", default=None, help="Append one JSON line per ffmpeg run to this file")
+    parser.add_argument("--prom", default=None, help="Write a Prometheus textfile with the run totals here")
+    parser.add_argument("--progress", action="store_true", help="Print ffmpeg progress of running jobs")
+    parser.add_argument(
+        "--progress-interval",
+        default=5.0,
+        type=float,
+        help="Seconds between progress lines of one job (with --progress)",
+    )
     parser.add_argument("--dry-run", action="store_true")
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        print("--jobs must be at least 1")
+        return 1
+    if args.thumbs and (
+        args.sprite_interval <= 0 or args.sprite_cols < 1 or args.sprite_rows < 1 or args.thumb_width < 2
+    ):
+        print("--sprite-interval, --sprite-cols, --sprite-rows and --thumb-width must be positive")
+        return 1
+    args.marker_types = [name.strip() for name in args.marker_types.split(",") if name.strip()]
+    if not args.marker_types or args.marker_pre < 0 or args.marker_post < 0 or args.marker_pre + args.marker_post <= 0:
+        print("--marker-types must name a type and --marker-pre/--marker-post must give a window")
+        return 1
+    if args.proxy_min_ratio <= 0:
+        print("--proxy-min-ratio must be positive")
+        return 1
+    if args.check_proxy:
+        return check_proxy(args)
+    threads = threads_per_job(args)
+
     base_dir = os.path.dirname(os.path.abspath(args.db))
     out_base = args.out_dir or base_dir
+    if args.proxy_dir:
+        args.proxy_dir = resolve_path(base_dir, args.proxy_dir)
 
-    conn = sqlite3.connect(args.db)
-    conn.row_factory = sqlite3.Row
+    conn = connect_db(args.db)
     try:
         ensure_schema(conn)
+        if args.enqueue or args.worker:
+            jobqueue.ensure_queue_schema(conn)
     except RuntimeError as exc:
         print(str(exc))
         return 1
 
-    originals = conn.execute(
-        "SELECT * FROM media_file WHERE parent_id IS NULL AND kind = 'original'"
-    ).fetchall()
-
-    if not originals:
-        print("No original media files found.")
+    if args.probe_only:
+        total, hits, probed = refresh_originals(conn, base_dir, ORIGINALS_SQL, args.probe_jobs, force_probe=True)
+        print(f"Probe cache: {total} originals, {hits} cached, {probed} probed, {total - hits - probed} failed.")
+        if args.keyframe_index:
+            paths = [resolve_path(base_dir, row["path"]) for row in conn.execute(ORIGINALS_SQL)]
+            indexed, cached = load_keyframe_index(conn, paths, args.probe_jobs)
+            print(f"Keyframe index: {len(indexed)} originals, {cached} cached.")
+        conn.close()
         return 0
 
-    for media in originals:
-        media_id = media["id"]
-        in_path = resolve_path(base_dir, media["path"])
-        if not os.path.exists(in_path):
-            print(f"Missing input: {in_path} (media_id={media_id})")
-            continue
-
-        raw_ts = parse_ts(media["raw_mtime"]) or file_mtime(in_path)
-        poi_ts = parse_ts(media["poi_mtime"])
-        conv_ts = parse_ts(media["conv_mtime"])
-        poi_max_ts = load_poi_max_ts(conn, media_id)
-
-        if any(media[key] is None for key in ("width", "height", "frame_rate", "codec", "duration", "start_time")):
-            meta = probe_media(in_path)
-            if meta:
-                for key, value in meta.items():
-                    if media[key] is None and value is not None:
-                        conn.execute(
-                            f"UPDATE media_file SET {key} = ? WHERE id = ?",
-                            (value, media_id),
-                        )
-                conn.commit()
-
-        needs_base = conv_ts is None or (raw_ts and raw_ts > conv_ts)
-        poi_changed = (
-            conv_ts is None
-            or (poi_ts and poi_ts > conv_ts)
-            or (poi_max_ts and poi_max_ts > conv_ts)
-        )
-
-        edit_points = load_edit_points(conn, media_id)
-        if not edit_points:
-            print(f"No edit points for media_id={media_id}")
-            continue
-
-        updated_outputs = []
-        ran_any = False
-
-        for ep in edit_points:
-            out_path = resolve_path(out_base, ep["out_path"])
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            out_w = ep["out_width"] or args.out_w
-            out_h = ep["out_height"] or args.out_h
-            if not out_w or not out_h:
-                print(f"Missing output size for out_id={ep['out_id']}")
-                continue
-
-            cfg_start = ep["out_cfg_start"]
-            if cfg_start is None:
-                cfg_start = media["cfg_start"]
-            max_duration = ep["out_cfg_max_duration"]
-            if max_duration is None:
-                max_duration = media["cfg_max_duration"]
-            if max_duration is None and args.duration is not None:
-                max_duration = args.duration
-
-            if ep["out_kind"] == "snapshot_base":
-                if not needs_base:
-                    continue
-                ok = render_base(
-                    in_path,
-                    out_path,
-                    out_w,
-                    out_h,
-                    cfg_start,
-                    max_duration,
-                    ep["out_codec"],
-                    ep["out_frame_rate"],
-                    args.dry_run,
-                )
-            else:
-                if not (needs_base or poi_changed):
-                    continue
-                poi_updated = parse_ts(ep["poi_updated_at"])
-                if not needs_base and conv_ts and poi_updated and poi_updated <= conv_ts and (not poi_ts or poi_ts <= conv_ts):
-                    continue
-                ok = render_poi(
-                    in_path,
-                    out_path,
-                    out_w,
-                    out_h,
-                    cfg_start,
-                    max_duration,
-                    ep["out_codec"],
-                    ep["out_frame_rate"],
-                    ep,
-                    args.dry_run,
-                )
-
-            if ok:
-                updated_outputs.append(ep["out_id"])
-                ran_any = True
-            else:
-                print(f"ffmpeg failed for output: {out_path}")
-
-        if ran_any:
-            ts_now = iso_now()
-            conn.execute(
-                "UPDATE media_file SET conv_mtime = ? WHERE id = ?",
-                (ts_now, media_id),
-            )
-            for out_id in updated_outputs:
-                conn.execute(
-                    "UPDATE media_file SET conv_mtime = ? WHERE id = ?",
-                    (ts_now, out_id),
-                )
+    if args.auto_encoder:
+        args.encoder_picks = pick_encoders(args)
 
-        if media["raw_mtime"] is None and raw_ts:
-            conn.execute(
-                "UPDATE media_file SET raw_mtime = ? WHERE id = ?",
-                (raw_ts.isoformat(timespec="seconds").replace("+00:00", "Z"), media_id),
-            )
+    metrics = run_metrics.RunMetrics(args.metrics, args.progress, args.progress_interval)
+    if args.worker and not args.enqueue:
+        conn.close()
+        try:
+            work_queue(base_dir, out_base, args, threads, metrics)
+        finally:
+            finish_metrics(metrics, args)
+        return 0
 
-        conn.commit()
+    planned_at = iso_now()
+    if args.dirty:
+        planned = plan_dirty(conn, base_dir, out_base, args)
+    else:
+        planned = plan_originals(conn, base_dir, out_base, args)
+    if args.enqueue:
+        conn.close()
+        enqueue_plan(args.db, planned, planned_at)
+        if args.worker:
+            try:
+                work_queue(base_dir, out_base, args, threads, metrics)
+            finally:
+                finish_metrics(metrics, args)
+        return 0
 
+    try:
+        render_plan(conn, planned, args, threads, metrics=metrics)
+    finally:
+        finish_metrics(metrics, args)
     conn.close()
     return 0
 